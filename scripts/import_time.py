@@ -0,0 +1,90 @@
+"""
+This script measures how long the analysis modules take to import in a fresh Python
+process and checks that the computational modules do not pull in the notebook stack.
+Functions:
+- import_time(module, repeats):
+- heavy_modules(module):
+Main Execution:
+- Parses command line arguments for the modules to import, the number of repeats and
+  the time budget in seconds.
+- Imports every module `repeats` times, each time in a new interpreter, and prints the
+  median import time.
+- Reports modules that import holoviews, bokeh, IPython or PIL at import time, and
+  modules whose median import time exceeds the budget. Exits with status 1 if any.
+Usage:
+    python scripts/import_time.py
+    python scripts/import_time.py --modules src.FreezeAnalysis --budget 1.5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("holoviews", "bokeh", "IPython", "PIL")
+
+
+def import_time(module, repeats=5):
+    """Median wall time in seconds to import `module` in a fresh interpreter."""
+    code = (
+        "import time; t = time.perf_counter(); import {m}; "
+        "print(time.perf_counter() - t)".format(m=module)
+    )
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def heavy_modules(module):
+    """Visualization packages that are loaded by importing `module`."""
+    code = (
+        "import sys; import {m}; "
+        "print(' '.join(sorted({{n.split('.')[0] for n in sys.modules}})))"
+    ).format(m=module)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    loaded = set(out.stdout.strip().splitlines()[-1].split())
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import time of modules.")
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["src.video_index", "src.FreezeAnalysis", "src.video"],
+        help="Modules to import",
+    )
+    parser.add_argument("--repeats", type=int, default=5, help="Imports per module")
+    parser.add_argument(
+        "--budget", type=float, default=2.0, help="Maximum median import time (s)"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        seconds = import_time(module, args.repeats)
+        heavy = heavy_modules(module)
+        print(f"{module}: {seconds:.3f} s")
+        if heavy:
+            print(f"  imports {', '.join(heavy)} at import time")
+            failed = True
+        if seconds > args.budget:
+            print(f"  exceeds budget of {args.budget:.3f} s")
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -3,7 +3,18 @@ This script extracts data from long recordings and processes fiber photometry da
 Functions:
 - calculate_recording_start_times(recording_start_datetime, onsets):
 - format_datetime_for_filename(dt):
-- create_output_folder(data_dir, overwrite=False, alternative_name=None):
+- create_output_folder(data_dir, overwrite=False, alternative_name=None, resume=False):
+- extract_segment(data_path, t1, t2, recording=None):
+- save_segment(data_to_save, save_path, sampling_frequency, start_datetime, compression="default"):
+- share_streams(recording):
+- process_segments_parallel(data_path, segments, workers, recording=None, compression="default"):
+- tank_state(data_path):
+- parameters_digest(parameters):
+- segment_key(onset, offset):
+- load_manifest(save_dir):
+- save_manifest(save_dir, manifest):
+- is_segment_current(entry, parameters, state, save_dir):
+- record_segment(manifest, save_dir, key, save_path, parameters, state):
 Main Execution:
 - Parses command line arguments for data directory, overwrite option, and alternative folder name.
 - Validates the existence and non-emptiness of the data directory.
@@ -11,22 +22,46 @@ Main Execution:
 - Imports TDT data and extracts onset and offset times.
 - Calculates recording start times.
 - Iterates over onsets and offsets to process and save fiber photometry data segments.
+  By default the streams are read from the tank once and every segment is sliced from
+  that buffer (`--read_mode single`). `--read_mode segment` re-reads the tank for
+  each segment, which needs less memory but is much slower.
+- With `--workers N` the segments are processed by a pool of N processes. The streams
+  are placed in shared memory once, so the workers slice them without copies. Segments
+  are saved and logged in onset order regardless of which worker finishes first.
+- Segments are saved as csv by default. `--format parquet|hdf5|npz` saves float32
+  columns in a compressed binary file together with the sampling frequency and the
+  segment start datetime. Such files are read back with `fp.load_segment`.
+- Every saved segment is recorded in `manifest.json` in the output folder, keyed by its
+  onset/offset, together with the size/mtime of every tank file (.tsq/.tev/.sev)
+  and a digest of the pipeline parameters. With `--resume` the existing output folder
+  (or the `--alt_folder`) is kept and only new segments, and segments of which the
+  parameters or any tank file changed, are extracted, so the script can be rerun after
+  a crash. Segments without an offset yet are skipped, and the streams are only read
+  for the time range of the pending segments.
 
 created by: Gergely Turi 11/29/2024
 """
 
 import argparse as ap
+import hashlib
+import json
 import os
 import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
-from os.path import isdir, join
+from os.path import basename, isdir, join
 
-import pandas as pd
+import numpy as np
 
 import src.fiberphotometry as fp
 import src.logging_module as lm
 
+MANIFEST_NAME = "manifest.json"
+
+# per-process state of the pool workers, set by `_init_worker`
+_worker_state = {}
+
 
 def calculate_recording_start_times(recording_start_datetime, onsets):
     """
@@ -65,7 +100,9 @@ def format_datetime_for_filename(dt):
     return dt.strftime("%Y%m%d_%H%M%S")
 
 
-def create_output_folder(data_dir, overwrite=False, alternative_name=None):
+def create_output_folder(
+    data_dir, overwrite=False, alternative_name=None, resume=False
+):
     """
     Create an output folder named "analysis" inside the given data directory.
 
@@ -76,6 +113,10 @@ def create_output_folder(data_dir, overwrite=False, alternative_name=None):
         Whether to overwrite the existing "analysis" folder if it exists.
     - alternative_name: str or None
         An alternative name for the output folder if "analysis" already exists.
+    - resume: bool
+        Whether to keep using the existing output folder, e.g. to continue an
+        interrupted extraction. With `alternative_name`, the alternative folder is
+        resumed instead.
 
     Returns:
     - str: The path to the output folder.
@@ -87,13 +128,18 @@ def create_output_folder(data_dir, overwrite=False, alternative_name=None):
             lm.log_info("Overwriting existing 'analysis' folder.")
             shutil.rmtree(output_folder)
             os.makedirs(output_folder)
+        elif resume:
+            if alternative_name:
+                output_folder = join(data_dir, alternative_name)
+                os.makedirs(output_folder, exist_ok=True)
+            lm.log_info(f"Resuming in existing folder '{output_folder}'.")
         elif alternative_name:
             output_folder = join(data_dir, alternative_name)
             lm.log_info(f"Creating alternative folder '{alternative_name}'.")
             os.makedirs(output_folder, exist_ok=True)
         else:
             lm.log_error(
-                "The 'analysis' folder already exists. Use '--overwrite' or specify an alternative folder name."
+                "The 'analysis' folder already exists. Use '--overwrite', '--resume' or specify an alternative folder name."
             )
             sys.exit(1)
     else:
@@ -103,6 +149,294 @@ def create_output_folder(data_dir, overwrite=False, alternative_name=None):
     return output_folder
 
 
+def extract_segment(data_path, t1, t2, recording=None):
+    """
+    Extract the raw channels and the dF/F of one recording segment.
+
+    Parameters:
+    - data_path: str
+        The directory containing the data.
+    - t1: float
+        Start of the segment in seconds.
+    - t2: float
+        End of the segment in seconds.
+    - recording: fp.ImportTDTData or None
+        Streams already read from the tank. If given, the segment is sliced from it,
+        otherwise the segment is read from the tank.
+
+    Returns:
+    - dict: raw 405 nm, raw 465 nm and dF/F arrays of the segment.
+    - float: the sampling frequency of the segment.
+    """
+    if recording is not None:
+        data_segment = recording.segment(t1, t2)
+    else:
+        data_segment = fp.ImportTDTData(data_path, kwargs={"t1": t1, "t2": t2})
+    raw_data = data_segment.raw_data
+
+    processed_data = fp.FiberPhotometryAnalysis(data_path, photometry=data_segment)
+    dff = processed_data.calculate_deltaf_f()
+
+    data_to_save = {
+        "raw_405nm": raw_data["isos"],
+        "raw_465nm": raw_data["dynamic"],
+        "dff": dff,
+    }
+    return data_to_save, data_segment.sampling_frequency
+
+
+def save_segment(
+    data_to_save, save_path, sampling_frequency, start_datetime, compression="default"
+):
+    """
+    Save the data of one segment. The file format follows the extension of `save_path`.
+
+    Parameters:
+    - data_to_save: dict
+        The arrays returned by `extract_segment`.
+    - save_path: str
+        The path of the output file (.csv, .parquet, .h5 or .npz).
+    - sampling_frequency: float
+        The sampling frequency of the segment, saved as metadata.
+    - start_datetime: datetime.datetime
+        The start of the segment, saved as metadata.
+    - compression: str or None
+        Compression of the binary formats, see `fp.save_segment`.
+    """
+    fp.save_segment(
+        data_to_save,
+        save_path,
+        sampling_frequency=sampling_frequency,
+        start_datetime=start_datetime,
+        compression=compression,
+    )
+
+
+def share_streams(recording):
+    """
+    Move the photometry streams of a recording into shared memory.
+
+    Parameters:
+    - recording: fp.ImportTDTData
+        The recording with the streams loaded. Its streams are replaced by views of the
+        shared memory, so the streams are held once for all workers.
+
+    Returns:
+    - fp.SharedStreams: the shared streams, sent to the workers to attach to them. The
+      caller has to unlink them.
+    """
+    return recording.share_streams("memory")
+
+
+def _init_worker(data_path, shared, compression):
+    """Attach a pool worker to the shared streams (if any)."""
+    _worker_state["data_path"] = data_path
+    _worker_state["compression"] = compression
+    _worker_state["recording"] = None
+    if shared is None:
+        return
+    _worker_state["recording"] = fp.ImportTDTData.attach(data_path, shared)
+
+
+def _process_segment(segment):
+    """Extract and save one segment in a pool worker."""
+    t1, t2, start, save_path = segment
+    data_to_save, sampling_frequency = extract_segment(
+        _worker_state["data_path"], t1, t2, recording=_worker_state["recording"]
+    )
+    save_segment(
+        data_to_save,
+        save_path,
+        sampling_frequency,
+        start,
+        compression=_worker_state["compression"],
+    )
+    return save_path
+
+
+def process_segments_parallel(
+    data_path, segments, workers, recording=None, compression="default"
+):
+    """
+    Extract and save segments with a pool of processes.
+
+    Parameters:
+    - data_path: str
+        The directory containing the data.
+    - segments: list of tuples
+        (t1, t2, start datetime, save_path) of every segment.
+    - workers: int
+        Number of worker processes.
+    - recording: fp.ImportTDTData or None
+        Streams already read from the tank. They are shared with the workers through
+        shared memory. If None, every worker reads its segments from the tank.
+    - compression: str or None
+        Compression of the binary formats, see `fp.save_segment`.
+
+    Yields:
+    - str: the path of each saved segment, in the order of `segments`.
+    """
+    shared = share_streams(recording) if recording is not None else None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(data_path, shared, compression),
+        ) as executor:
+            yield from executor.map(_process_segment, segments)
+    finally:
+        if shared is not None:
+            shared.unlink()
+
+
+def tank_state(data_path):
+    """
+    Get the size and the modification time of every tank file.
+
+    Parameters:
+    - data_path: str
+        The directory containing the data.
+
+    Returns:
+    - dict: {file name: {"size": size in bytes, "mtime": mtime in ns}} of the
+      .tsq/.tev/.sev files.
+    """
+    state = {}
+    for file_name in sorted(os.listdir(data_path)):
+        if file_name.lower().endswith((".tsq", ".tev", ".sev")):
+            stat = os.stat(join(data_path, file_name))
+            state[file_name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    return state
+
+
+def parameters_digest(parameters):
+    """
+    Create a digest of the pipeline parameters.
+
+    Parameters:
+    - parameters: dict
+        The parameters that affect the extracted data. Must be json serializable.
+
+    Returns:
+    - str: sha1 hex digest of the parameters.
+    """
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+def segment_key(onset, offset):
+    """
+    Create the manifest key of a segment.
+
+    Parameters:
+    - onset: float
+        The onset of the segment in seconds.
+    - offset: float
+        The offset of the segment in seconds.
+
+    Returns:
+    - str: the key of the segment.
+    """
+    return f"{onset:.6f}_{offset:.6f}"
+
+
+def load_manifest(save_dir):
+    """
+    Load the manifest of the extracted segments.
+
+    Parameters:
+    - save_dir: str
+        The output folder.
+
+    Returns:
+    - dict: the manifest. Empty if the folder has no (readable) manifest.
+    """
+    manifest_path = join(save_dir, MANIFEST_NAME)
+    if os.path.isfile(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            lm.log_warning(f"Could not read {manifest_path} ({e}), starting a new one.")
+    return {"segments": {}}
+
+
+def save_manifest(save_dir, manifest):
+    """
+    Save the manifest of the extracted segments. The file is replaced atomically, so
+    an interruption never leaves a partially written manifest.
+
+    Parameters:
+    - save_dir: str
+        The output folder.
+    - manifest: dict
+        The manifest.
+    """
+    manifest_path = join(save_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def is_segment_current(entry, parameters, state, save_dir):
+    """
+    Check whether a segment in the manifest is up to date.
+
+    A segment is up to date if it was extracted with the same parameters, its file
+    still exists and every tank file has the same size and modification time as when
+    it was extracted.
+
+    Parameters:
+    - entry: dict or None
+        The manifest entry of the segment.
+    - parameters: str
+        The digest of the current pipeline parameters.
+    - state: dict
+        The current `tank_state`.
+    - save_dir: str
+        The output folder.
+
+    Returns:
+    - bool: True if the segment does not need to be extracted again.
+    """
+    if entry is None or entry["parameters"] != parameters:
+        return False
+    if not os.path.isfile(join(save_dir, entry["file"])):
+        return False
+    return entry["tank"] == state
+
+
+def record_segment(manifest, save_dir, key, save_path, parameters, state):
+    """
+    Record a saved segment in the manifest and save the manifest.
+
+    Parameters:
+    - manifest: dict
+        The manifest.
+    - save_dir: str
+        The output folder.
+    - key: str
+        The `segment_key` of the segment.
+    - save_path: str
+        The path of the saved segment.
+    - parameters: str
+        The digest of the pipeline parameters.
+    - state: dict
+        The `tank_state` the segment was extracted from.
+    """
+    previous = manifest["segments"].get(key)
+    if previous is not None and previous["file"] != basename(save_path):
+        # the segment was saved under another name before, e.g. in another format
+        old_path = join(save_dir, previous["file"])
+        if os.path.isfile(old_path):
+            os.remove(old_path)
+    manifest["segments"][key] = {
+        "file": basename(save_path),
+        "parameters": parameters,
+        "tank": state,
+    }
+    save_manifest(save_dir, manifest)
+
+
 if __name__ == "__main__":
     # Setup logging
     lm.setup_logging(log_file_name="long_rec_data_extraction.log")
@@ -121,6 +455,38 @@ if __name__ == "__main__":
         help="Alternative name for the analysis folder if 'analysis' already exists.",
         default=None,
     )
+    parser.add_argument(
+        "--read_mode",
+        type=str,
+        choices=["single", "segment"],
+        default="single",
+        help="'single' reads the streams once and slices every segment from memory, "
+        "'segment' re-reads the tank for each segment.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to process the segments in parallel.",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["csv", "parquet", "hdf5", "npz"],
+        default="csv",
+        help="File format of the saved segments.",
+    )
+    parser.add_argument(
+        "--no_compression",
+        action="store_true",
+        help="Save binary formats uncompressed, so they can be memory-mapped when loaded.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep the existing output folder (or --alt_folder) and extract only new "
+        "or changed segments.",
+    )
     args = parser.parse_args()
 
     # Set the data path and create the output folder
@@ -136,7 +502,10 @@ if __name__ == "__main__":
 
     # Set the data path and create the output folder
     save_dir = create_output_folder(
-        data_path, overwrite=args.overwrite, alternative_name=args.alt_folder
+        data_path,
+        overwrite=args.overwrite,
+        alternative_name=args.alt_folder,
+        resume=args.resume,
     )
     onset_add_time = float(10)  # seconds to add onset time to get rid of the artifact
 
@@ -166,40 +535,93 @@ if __name__ == "__main__":
         recording_start_date_time, on_off_times["onsets"]
     )
 
-    # Iterate through each onset and offset to extract data
+    # Collect the segments that are not extracted yet
+    extension = {"hdf5": "h5"}.get(args.format, args.format)
+    compression = None if args.no_compression else "default"
+    parameters = parameters_digest(
+        {
+            "onset_add_time": onset_add_time,
+            "format": args.format,
+            "compression": compression,
+            "dff_strategy": "default",
+        }
+    )
+    state = tank_state(data_path)
+    manifest = load_manifest(save_dir)
+    segments = []
+    segment_keys = {}
     for on, off, start in zip(
         on_off_times["onsets"], on_off_times["offsets"], recording_starts
     ):
+        if not np.isfinite(off):
+            lm.log_warning(
+                f"Segment starting at {on:.2f} s has no offset (recording still running?), skipping."
+            )
+            continue
+        key = segment_key(on, off)
+        if is_segment_current(manifest["segments"].get(key), parameters, state, save_dir):
+            continue
         adjusted_on = on + onset_add_time
-        data_segment = fp.ImportTDTData(
-            data_path,
+        save_name = f"fiber_data_{format_datetime_for_filename(start)}_{round(adjusted_on)}_{round(off)}.{extension}"
+        data_start = recording_start_date_time + timedelta(seconds=float(adjusted_on))
+        save_path = join(save_dir, save_name)
+        segments.append((float(adjusted_on), float(off), data_start, save_path))
+        segment_keys[save_path] = key
+
+    n_done = len(on_off_times["onsets"]) - len(segments)
+    if n_done:
+        lm.log_info(f"{n_done} segments are up to date or incomplete, skipping them.")
+    if not segments:
+        lm.log_info("No new segments to extract.")
+        sys.exit(0)
+
+    # Read the streams once, covering only the segments to extract
+    recording = None
+    if args.read_mode == "single":
+        lm.log_info("Importing recording streams.")
+        recording = fp.ImportTDTData(
+            tank_path=data_path,
             kwargs={
-                "t1": float(adjusted_on),
-                "t2": float(off),
+                "evtype": ["streams"],
+                "t1": min(segment[0] for segment in segments),
+                "t2": max(segment[1] for segment in segments),
             },
         )
-        raw_ISO = data_segment.raw_data["isos"]
-        raw_dynamic = data_segment.raw_data["dynamic"]
 
-        processed_data = fp.FiberPhotometryAnalysis(
-            data_path,
-            kwargs={
-                "t1": float(adjusted_on),
-                "t2": float(off),
-            },
+    # Iterate through each onset and offset to extract data
+    if args.workers > 1:
+        lm.log_info(
+            f"Processing {len(segments)} segments with {args.workers} workers."
         )
+        for save_path in process_segments_parallel(
+            data_path,
+            segments,
+            args.workers,
+            recording=recording,
+            compression=compression,
+        ):
+            # the worker has already written the file
+            record_segment(
+                manifest, save_dir, segment_keys[save_path], save_path, parameters, state
+            )
+            lm.log_info(f"Data {basename(save_path)} is saved.")
+    else:
+        for t1, t2, start, save_path in segments:
+            data_to_save, sampling_frequency = extract_segment(
+                data_path, t1, t2, recording=recording
+            )
 
-        dff = processed_data.calculate_deltaf_f()
-
-        # Save the data
-        save_name = f"fiber_data_{format_datetime_for_filename(start)}_{round(adjusted_on)}_{round(off)}.csv"
-        lm.log_info(f"Saving data to {save_name}.")
-        data_to_save = {
-            "raw_405nm": raw_ISO,
-            "raw_465nm": raw_dynamic,
-            "dff": dff,
-        }
-
-        data_to_save_df = pd.DataFrame.from_dict(data_to_save)
-        data_to_save_df.to_csv(join(save_dir, save_name), index=False)
-        lm.log_info(f"Data {save_name} is saved.")
+            # Save the data
+            save_name = basename(save_path)
+            lm.log_info(f"Saving data to {save_name}.")
+            save_segment(
+                data_to_save,
+                save_path,
+                sampling_frequency,
+                start,
+                compression=compression,
+            )
+            record_segment(
+                manifest, save_dir, segment_keys[save_path], save_path, parameters, state
+            )
+            lm.log_info(f"Data {save_name} is saved.")
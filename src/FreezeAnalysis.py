@@ -4,14 +4,34 @@ LIST OF FUNCTIONS
 create_video_dict
 LoadAndCrop
 Measure_Motion
+MotionKernel
+prepare_frame
+FrameSource
 cropframe
+crop_bounds
+CropSpec
 Measure_Freezing
+Measure_Freezing_Sweep
+run_lengths
 Play_Video
 Play_Video_ext
 Save_Data
+LoadData
+freeze_epochs
+epochs_to_freezing
 Summarize
+Summarize_Files
+bin_means
 Batch
 Calibrate
+PixelChangeHistogram
+check_p_frames
+p_frame_proportion
+
+The interactive functions (LoadAndCrop, PlayVideo, PlayVideo_ext and the plot of
+Calibrate) import holoviews, IPython and PIL when they are first called, so the
+computational functions (Measure_Motion, Measure_Freezing, Summarize, Batch, ...) can
+be imported in headless jobs without the notebook stack.
 """
 
 ########################################################################################
@@ -19,20 +39,37 @@ Calibrate
 import os
 import cv2
 import fnmatch
+import json
 import numpy as np
 import pandas as pd
-import PIL.Image
+import queue
+import threading
 import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from tqdm import tqdm
-import holoviews as hv
-from holoviews import streams
-from io import BytesIO
-from IPython.display import clear_output, Image, display
+from .video_index import frame_count, frame_index, load_check, save_check, seek_frame
 
-hv.notebook_extension("bokeh")
 warnings.filterwarnings("ignore")
 
+_HV = None
+_OUTPUT_VERSION = 1
+
+########################################################################################
+
+
+def _holoviews():
+    """Imports holoviews and loads its bokeh notebook extension on first use."""
+    global _HV
+    if _HV is None:
+        import holoviews as hv
+
+        hv.notebook_extension("bokeh")
+        _HV = hv
+    return _HV
+
+
 ########################################################################################
 
 
@@ -154,6 +191,9 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
             Method of cropping video.  cropmethod takes the following values:
                 None : No cropping
                 'Box' : Create box selection tool for cropping video
+                'Poly' : Create polygon drawing tool for cropping video. Pixels
+                         outside the polygon are ignored.
+                CropSpec or path of a saved CropSpec : Use a saved crop
 
         fstfile:: [bool]
             Dictates whether to use first file in video_dict['FileNames'] to generate
@@ -193,6 +233,8 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
         - in the case of batch processing, video_dict['file'] is set to first
           video in file
         - prior cropping method HLine has been removed
+        - a drawn crop can be saved for batch runs on machines without a notebook
+          with `CropSpec.from_crop(video_dict['crop']).save(path)`
 
     """
 
@@ -214,7 +256,7 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
         )
 
     # Print video information. Note that max frame is updated later if fewer frames detected
-    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap_max = frame_count(video_dict["fpath"], cap)
     print("total frames: {frames}".format(frames=cap_max))
     print("nominal fps: {fps}".format(fps=cap.get(cv2.CAP_PROP_FPS)))
     print(
@@ -226,11 +268,11 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
 
     # check for video p-frames
     if not accept_p_frames:
-        check_p_frames(cap)
+        check_p_frames(video_dict["fpath"])
 
     # Set first frame.
     try:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, video_dict["start"])
+        seek_frame(cap, video_dict["fpath"], video_dict["start"])
     except:
         cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
     ret, frame = cap.read()
@@ -247,6 +289,7 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
     cap.release()
 
     # Make first image reference frame on which cropping can be performed
+    hv = _holoviews()
     image = hv.Image((np.arange(frame.shape[1]), np.arange(frame.shape[0]), frame))
     image.opts(
         width=int(frame.shape[1] * video_dict["stretch"]["width"]),
@@ -267,14 +310,31 @@ def LoadAndCrop(video_dict, cropmethod=None, fstfile=False, accept_p_frames=Fals
     if cropmethod == "Box":
         box = hv.Polygons([])
         box.opts(alpha=0.5)
-        video_dict["crop"] = streams.BoxEdit(source=box, num_objects=1)
+        video_dict["crop"] = hv.streams.BoxEdit(source=box, num_objects=1)
         return (image * box), video_dict
 
+    if cropmethod == "Poly":
+        poly = hv.Polygons([])
+        poly.opts(alpha=0.5)
+        video_dict["crop"] = hv.streams.PolyDraw(source=poly, num_objects=1)
+        return (image * poly), video_dict
+
+    crop = CropSpec.from_crop(cropmethod)
+    if crop.vertices is None:
+        ymin, ymax, xmin, xmax = crop.bounds
+        corners = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+        outline = hv.Polygons([corners])
+    else:
+        outline = hv.Polygons([crop.vertices])
+    outline.opts(alpha=0.5)
+    video_dict["crop"] = crop
+    return (image * outline), video_dict
+
 
 ########################################################################################
 
 
-def Measure_Motion(video_dict, mt_cutoff, SIGMA=1):
+def Measure_Motion(video_dict, mt_cutoff, SIGMA=1, n_workers=1, rois=None):
     """
     -------------------------------------------------------------------------------------
 
@@ -303,81 +363,489 @@ def Measure_Motion(video_dict, mt_cutoff, SIGMA=1):
                               processed.  [list]
                 'cal_frms' : number of frames to calibrate based upon
 
-        mt_cutoff:: [float]
+        mt_cutoff:: [float or array-like]
             Threshold value for determining magnitude of change sufficient to mark
-            pixel as changing from prior frame.
+            pixel as changing from prior frame. If array-like, motion is measured for
+            every cutoff in the same pass over the video (see Returns).
 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to
             OpenCV `cv2.GuassianBlur`.
 
+        n_workers:: [int]
+            Number of processes. If larger than 1, the frames are split into
+            `n_workers` ranges that are processed in parallel, each with its own
+            `cv2.VideoCapture`. Consecutive ranges overlap by one frame, so the result
+            is identical to the serial one. Requires a video that can be seeked
+            frame-accurately (see `check_p_frames`).
+
+        rois:: [list]
+            Regions of interest, e.g. one per chamber of a multi-chamber rig. Each
+            region is any crop specification accepted by `CropSpec.from_crop` (box or
+            polygon), in the coordinates of the (downsampled) frame shown by
+            `LoadAndCrop`. Motion is counted per region in the same pass over the
+            video. Set to None to count over the whole (cropped) frame.
+
     -------------------------------------------------------------------------------------
     Returns:
         Motion:: [numpy.array]
             Array containing number of pixels per frame whose intensity change from
             previous frame exceeds `mt_cutoff`. Length is number of frames passed to
             function to loop through. Value of first index, corresponding to first frame,
-            is set to 0.
+            is set to 0. If `mt_cutoff` is array-like, shape is
+            (number of frames, len(mt_cutoff)) and `Motion[:, i]` is the motion for
+            `mt_cutoff[i]`. With `rois`, a last axis of length len(rois) is added and
+            `Motion[..., j]` is the motion within `rois[j]`.
 
     -------------------------------------------------------------------------------------
     Notes:
+        - To choose `mt_cutoff`, pass a grid of candidate cutoffs, e.g.
+          `np.arange(0, 50.5, 0.5)`, and pick columns afterwards without decoding
+          the video again.
+        - Freezing of every region is scored with `Measure_Freezing(Motion, ...)` and
+          summarized per region with `Summarize`.
+        - With a polygon crop, frames are cropped to the bounding box of the polygon
+          and blurred, and only pixels inside the polygon are counted, so the blur
+          does not carry changes across the edge of the polygon.
 
     """
 
     # Upoad file
-    cap = cv2.VideoCapture(video_dict["fpath"])
-    cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap_max = frame_count(video_dict["fpath"])
     cap_max = int(video_dict["end"]) if video_dict["end"] is not None else cap_max
-    cap.set(cv2.CAP_PROP_POS_FRAMES, video_dict["start"])
+    crop = CropSpec.from_crop(video_dict.get("crop"))
+    box = None if crop is None else crop.bounding_box()
+    rois = None if rois is None else [CropSpec.from_crop(roi) for roi in rois]
+    shape = np.shape(mt_cutoff) + (() if rois is None else (len(rois),))
+
+    if n_workers > 1:
+        Motion = np.zeros((cap_max - video_dict["start"],) + shape)
+        ranges = np.array_split(np.arange(1, len(Motion)), n_workers)
+        ranges = [(r[0], r[-1] + 1) for r in ranges if len(r) > 0]
+        failed = []
+        time.sleep(0.2)  # allow printing
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            jobs = [
+                executor.submit(
+                    _measure_motion_range,
+                    video_dict["fpath"],
+                    video_dict["start"],
+                    first,
+                    stop,
+                    video_dict["dsmpl"],
+                    crop,
+                    mt_cutoff,
+                    SIGMA,
+                    rois,
+                )
+                for first, stop in ranges
+            ]
+            for (first, _), job in tqdm(zip(ranges, jobs), total=len(jobs)):
+                values, failed_at = job.result()
+                Motion[first : first + len(values)] = values
+                if failed_at is not None:
+                    failed.append(failed_at)
+        if failed:
+            # as in the serial loop, stop at the first frame that could not be read
+            Motion = Motion[: min(failed) - 1]
+        time.sleep(0.2)  # allow printing
+        print("total frames processed: {f}\n".format(f=len(Motion)))
+        return Motion
+
+    with FrameSource(
+        video_dict["fpath"], video_dict["start"], cap_max, video_dict["dsmpl"], box
+    ) as frames:
+        # Initialize first frame and array to store motion values in
+        ret, frame_new = frames.read()
+        mask = _crop_mask(crop, frames.height, frames.width, frames.dsmpl)
+        kernel = MotionKernel(mt_cutoff, SIGMA, _roi_masks(rois, frames), mask)
+        kernel.reset(frame_new)
+        Motion = np.zeros((cap_max - video_dict["start"],) + shape)
+
+        # Loop through frames to detect frame by frame differences
+        time.sleep(0.2)  # allow printing
+        for x in tqdm(range(1, len(Motion))):
+            ret, frame_new = frames.read()
+            if ret:
+                # Reset new frame and calculate difference between old/new frames
+                Motion[x] = kernel(frame_new)
+            else:
+                # if no frame is detected
+                x = x - 1  # Reset x to last frame detected
+                Motion = Motion[:x]  # Amend length of motion vector
+                break
 
-    # Initialize first frame and array to store motion values in
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    if video_dict["dsmpl"] < 1:
-        frame_new = cv2.resize(
-            frame_new,
+    time.sleep(0.2)  # allow printing
+    print("total frames processed: {f}\n".format(f=len(Motion)))
+    return Motion  # return motion values
+
+
+def _measure_motion_range(
+    fpath, start, first, stop, dsmpl, crop, mt_cutoff, SIGMA, rois=None
+):
+    """
+    Measures motion of frames `first` to `stop` (relative to `start`) with a capture of
+    its own. Used by `Measure_Motion` with `n_workers` > 1. Returns the motion values
+    and the relative index of the first frame that could not be read (or None).
+    """
+    shape = np.shape(mt_cutoff) + (() if rois is None else (len(rois),))
+    values = np.zeros((stop - first,) + shape)
+    box = None if crop is None else crop.bounding_box()
+    with FrameSource(fpath, start + first - 1, start + stop, dsmpl, box) as frames:
+        ret, frame_new = frames.read()
+        if not ret:
+            return values[:0], first - 1
+        mask = _crop_mask(crop, frames.height, frames.width, dsmpl)
+        kernel = MotionKernel(mt_cutoff, SIGMA, _roi_masks(rois, frames), mask)
+        kernel.reset(frame_new)
+        for x in range(first, stop):
+            ret, frame_new = frames.read()
+            if not ret:
+                return values[: x - first], x
+            values[x - first] = kernel(frame_new)
+    return values, None
+
+
+def _roi_masks(rois, frames):
+    """Masks of `rois` (CropSpecs in full, downsampled frame coordinates) in the frames
+    returned by `frames`, a FrameSource, i.e. after downsampling and cropping."""
+    if rois is None:
+        return None
+    height, width = frames.height, frames.width
+    if frames.dsmpl < 1:
+        height, width = int(height * frames.dsmpl), int(width * frames.dsmpl)
+    masks = [roi.full_mask(height, width) > 0 for roi in rois]
+    if frames.crop is not None:
+        ymin, ymax, xmin, xmax = frames.crop.clip(height, width)
+        masks = [mask[ymin:ymax, xmin:xmax] for mask in masks]
+    return masks
+
+
+def _crop_mask(crop, height, width, dsmpl=1):
+    """Boolean mask of a polygon `crop` over frames of `height` x `width` pixels that
+    are downsampled by `dsmpl` and cropped to the bounding box of `crop`. None for a
+    box or no crop."""
+    if crop is None or crop.vertices is None:
+        return None
+    if dsmpl < 1:
+        height, width = int(height * dsmpl), int(width * dsmpl)
+    return crop.mask(height, width) > 0
+
+
+class MotionKernel:
+    """
+    -------------------------------------------------------------------------------------
+
+    Counts the pixels whose value changed by more than `mt_cutoff` between successive
+    frames. Frames are smoothed with a gaussian filter beforehand. All intermediate
+    images live in float32 buffers that are allocated once, on the first frame, and
+    reused for every later frame: the two blurred frames are swapped (ping-pong) rather
+    than copied, and `cv2.absdiff`/`cv2.threshold` write in place.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        mt_cutoff:: [float or array-like]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame. If array-like, the pixels are counted
+            for every cutoff and calling the kernel returns an array of counts.
+        SIGMA:: [float]
+            Sigma value for gaussian filter. Passed to OpenCV `cv2.GuassianBlur`.
+        rois:: [list]
+            Masks (2d boolean arrays of the frame shape) of N regions of interest. If
+            given, the changed pixels are counted per region and calling the kernel
+            returns an array of shape np.shape(mt_cutoff) + (N,).
+        mask:: [numpy.ndarray]
+            Mask (2d boolean array of the frame shape) of the pixels to count, e.g. of
+            a polygon crop. Pixels outside the mask are blurred with the rest of the
+            frame but never counted. None counts all pixels.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        With a few cutoffs the difference image is thresholded once per cutoff. With
+        many cutoffs every pixel difference is located among the sorted cutoffs with
+        `np.searchsorted` and the counts follow from a cumulative `np.bincount`, so
+        the cost hardly grows with the number of cutoffs. Both give the counts of
+        `cv2.threshold`, which compares in float32.
+
+        With regions of interest, every pixel is labelled once by the set of regions it
+        belongs to (regions may overlap). Per frame the changed pixels are counted per
+        label with one `np.bincount` and the label counts are summed per region with a
+        matrix product, so all regions are scored in a single pass over the frame.
+
+        Earlier versions blurred in float64. Blurring in float32 changes pixel values
+        by at most ~1e-4 grey levels, so a pixel only changes side when its difference
+        lies within that distance of `mt_cutoff`. On test videos the per-frame counts
+        differed by at most one pixel (typically not at all).
+
+    """
+
+    _MAX_THRESHOLD_LOOP = 8
+
+    def __init__(self, mt_cutoff, SIGMA=1, rois=None, mask=None):
+        self.SIGMA = SIGMA
+        self._src = None
+        # a mask is counted as the only region, or restricts every region
+        self._single = rois is None and mask is not None
+        if self._single:
+            rois = [mask]
+        elif rois is not None and mask is not None:
+            rois = [np.logical_and(roi, mask) for roi in rois]
+        self.rois = rois
+        if rois is not None:
+            masks = np.stack([np.asarray(m, dtype=bool).ravel() for m in rois])
+            # label pixels by region membership, membership[label, roi]
+            membership, labels = np.unique(masks.T, axis=0, return_inverse=True)
+            self._labels = labels.ravel()
+            self._membership = membership.astype(np.int64)
+        if np.ndim(mt_cutoff) == 0:
+            self.mt_cutoff = float(mt_cutoff)
+            self._cutoffs = None
+        else:
+            self.mt_cutoff = np.asarray(mt_cutoff, dtype=np.float32)
+            self._order = np.argsort(self.mt_cutoff, kind="stable")
+            self._cutoffs = self.mt_cutoff[self._order]
+
+    def reset(self, frame):
+        """Sets `frame` (2d uint8 array, see `prepare_frame`) as the reference frame."""
+        if self._src is None or self._src.shape != frame.shape:
+            self._src = np.empty(frame.shape, dtype=np.float32)
+            self._new = np.empty_like(self._src)
+            self._old = np.empty_like(self._src)
+            self._dif = np.empty_like(self._src)
+            self._cut = np.empty_like(self._src)
+        self._src[...] = frame
+        cv2.GaussianBlur(self._src, (0, 0), self.SIGMA, dst=self._new)
+
+    def difference(self, frame):
+        """Returns the absolute difference between the blurred `frame` and the blurred
+        previous frame. The returned buffer is reused by the next call."""
+        self._new, self._old = self._old, self._new
+        self._src[...] = frame
+        cv2.GaussianBlur(self._src, (0, 0), self.SIGMA, dst=self._new)
+        return cv2.absdiff(self._new, self._old, dst=self._dif)
+
+    def __call__(self, frame):
+        """Returns the number of pixels of `frame` that changed since the last frame."""
+        self.difference(frame)
+        if self.rois is not None:
+            counts = self._count_rois()
+            return counts[..., 0] if self._single else counts
+        if self._cutoffs is None:
+            cv2.threshold(self._dif, self.mt_cutoff, 1, cv2.THRESH_BINARY, dst=self._cut)
+            return cv2.countNonZero(self._cut)
+        if len(self._cutoffs) <= self._MAX_THRESHOLD_LOOP:
+            counts = np.empty(len(self._cutoffs), dtype=np.int64)
+            for i, cutoff in enumerate(self.mt_cutoff):
+                cv2.threshold(self._dif, float(cutoff), 1, cv2.THRESH_BINARY, self._cut)
+                counts[i] = cv2.countNonZero(self._cut)
+            return counts
+        # number of cutoffs below each pixel difference
+        below = np.searchsorted(self._cutoffs, self._dif.ravel(), side="left")
+        below = np.bincount(below, minlength=len(self._cutoffs) + 1)
+        above = np.cumsum(below[::-1])[::-1][1:]
+        counts = np.empty_like(above)
+        counts[self._order] = above
+        return counts
+
+    def _count_rois(self):
+        n_labels = len(self._membership)
+        if self._cutoffs is None:
+            # cv2.threshold compares in float32
+            changed = self._dif.ravel() > np.float32(self.mt_cutoff)
+            counts = np.bincount(self._labels[changed], minlength=n_labels)
+            return counts @ self._membership
+        # histogram of pixel differences among the sorted cutoffs, per label
+        n_bins = len(self._cutoffs) + 1
+        below = np.searchsorted(self._cutoffs, self._dif.ravel(), side="left")
+        below = np.bincount(self._labels * n_bins + below, minlength=n_labels * n_bins)
+        above = np.cumsum(below.reshape(n_labels, n_bins)[:, ::-1], axis=1)
+        above = above[:, ::-1][:, 1:]
+        counts = np.empty((len(self._cutoffs), self._membership.shape[1]), np.int64)
+        counts[self._order] = above.T @ self._membership
+        return counts
+
+
+def prepare_frame(frame, dsmpl, crop, gray=True):
+    """
+    -------------------------------------------------------------------------------------
+
+    Prepares a frame for motion detection: cropping, grayscale conversion and
+    downsampling. Without downsampling the BGR frame is cropped first, so that only
+    the region of interest is converted and later blurred. With downsampling the crop
+    coordinates refer to the downsampled frame, so the whole frame is resized before
+    it is cropped.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        frame:: [numpy.ndarray]
+            BGR frame as returned by `cv2.VideoCapture.read`
+        dsmpl:: [float]
+            proptional degree to which frame should be downsampled by (0-1).
+        crop:: [CropSpec or tuple]
+            CropSpec or (ymin, ymax, xmin, xmax) as returned by `crop_bounds`, or None
+        gray:: [bool]
+            Whether to convert the frame to grayscale.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        frame:: [numpy.ndarray]
+            2d uint8 numpy array (3d BGR array if `gray` is False). Pixels outside a
+            polygon crop are set to 0.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    crop = CropSpec.from_crop(crop)
+    if dsmpl < 1:
+        if gray:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame = cv2.resize(
+            frame,
             (
-                int(frame_new.shape[1] * video_dict["dsmpl"]),
-                int(frame_new.shape[0] * video_dict["dsmpl"]),
+                int(frame.shape[1] * dsmpl),
+                int(frame.shape[0] * dsmpl),
             ),
             cv2.INTER_NEAREST,
         )
-    frame_new = cropframe(frame_new, video_dict.get("crop"))
-    frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-    Motion = np.zeros(cap_max - video_dict["start"])
+        return frame if crop is None else crop.apply(frame)
+    if crop is not None:
+        frame = crop.apply(frame)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if gray else frame
 
-    # Loop through frames to detect frame by frame differences
-    time.sleep(0.2)  # allow printing
-    for x in tqdm(range(1, len(Motion))):
-        frame_old = frame_new
-        ret, frame_new = cap.read()
-        if ret:
-            # Reset new frame and process calculate difference between old/new frames
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            if video_dict["dsmpl"] < 1:
-                frame_new = cv2.resize(
-                    frame_new,
-                    (
-                        int(frame_new.shape[1] * video_dict["dsmpl"]),
-                        int(frame_new.shape[0] * video_dict["dsmpl"]),
-                    ),
-                    cv2.INTER_NEAREST,
-                )
-            frame_new = cropframe(frame_new, video_dict.get("crop"))
-            frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype("uint8")
-            Motion[x] = np.sum(frame_cut)
-        else:
-            # if no frame is detected
-            x = x - 1  # Reset x to last frame detected
-            Motion = Motion[:x]  # Amend length of motion vector
-            break
 
-    cap.release()  # release video
-    time.sleep(0.2)  # allow printing
-    print("total frames processed: {f}\n".format(f=len(Motion)))
-    return Motion  # return motion values
+class FrameSource:
+    """
+    -------------------------------------------------------------------------------------
+
+    Reads frames `start` to `stop` of a video in a background thread, so that decoding
+    overlaps with the processing of earlier frames. Frames are converted to grayscale,
+    downsampled and cropped in the reading thread (see `prepare_frame`) and handed
+    over through a bounded queue. `read` mirrors `cv2.VideoCapture.read`.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        fpath:: [str]
+            Path to video file.
+        start:: [int]
+            Frame at which to start. 0-based.
+        stop:: [int]
+            Frame at which to stop (exclusive). Set to None to read to the number of
+            frames reported by the video.
+        dsmpl:: [float]
+            proptional degree to which frames should be downsampled by (0-1).
+        crop:: [CropSpec or tuple]
+            CropSpec or (ymin, ymax, xmin, xmax) as returned by `crop_bounds`, or None
+        gray:: [bool]
+            Whether to convert frames to grayscale. If False, BGR frames are returned.
+        prefetch:: [int]
+            Maximum number of decoded frames held ahead of the consumer.
+        retrieve:: [numpy.ndarray]
+            Optional boolean mask over frames `start` to `stop`. Frames outside the
+            mask are only grabbed, which skips their conversion, and are read as
+            (True, None).
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        Use as a context manager, or call `close`, to stop the reading thread and
+        release the capture. As with `cv2.VideoCapture.read`, a failed read returns
+        (False, None) and reading continues with the next frame; once `stop` is
+        reached every read returns (False, None).
+
+    """
+
+    _END = object()
+
+    def __init__(
+        self,
+        fpath,
+        start=0,
+        stop=None,
+        dsmpl=1,
+        crop=None,
+        gray=True,
+        prefetch=32,
+        retrieve=None,
+    ):
+        self.fpath = fpath
+        self.dsmpl = dsmpl
+        self.crop = CropSpec.from_crop(crop)
+        self.gray = gray
+        self.retrieve = retrieve
+        self._cap = cv2.VideoCapture(fpath)
+        self.frame_count = frame_count(fpath, self._cap)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.start = start
+        self.stop = self.frame_count if stop is None else stop
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._closed = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            if self.start:
+                seek_frame(self._cap, self.fpath, self.start)
+            for i in range(self.stop - self.start):
+                if self.retrieve is not None and not self.retrieve[i]:
+                    ret, frame = self._cap.grab(), None
+                else:
+                    ret, frame = self._cap.read()
+                if ret and frame is not None:
+                    frame = prepare_frame(frame, self.dsmpl, self.crop, self.gray)
+                if not self._put((ret, frame if ret else None)):
+                    return
+            self._put(self._END)
+        except Exception as error:
+            self._put(error)
+        finally:
+            self._cap.release()
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self):
+        """Returns (ret, frame) for the next frame, like `cv2.VideoCapture.read`."""
+        if self._done:
+            return False, None
+        item = self._queue.get()
+        if item is self._END:
+            self._done = True
+            return False, None
+        if isinstance(item, Exception):
+            self._done = True
+            raise item
+        return item
+
+    def __iter__(self):
+        """Yields frames until the first failed read."""
+        while True:
+            ret, frame = self.read()
+            if not ret:
+                return
+            yield frame
+
+    def close(self):
+        """Stops the reading thread and releases the capture."""
+        self._closed.set()
+        self._done = True
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 ########################################################################################
@@ -393,28 +861,199 @@ def cropframe(frame, crop=None):
     Args:
         frame:: [numpy.ndarray]
             2d numpy array
-        crop:: [hv.streams.stream]
-            Holoviews stream object enabling dynamic selection in response to
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+        crop:: [CropSpec, hv.streams.stream, tuple, dict or str]
+            Crop specification, see `CropSpec.from_crop`. Set to None if no cropping
+            supplied.
 
     -------------------------------------------------------------------------------------
     Returns:
         frame:: [numpy.ndarray]
-            2d numpy array
+            2d numpy array. Pixels outside a polygon crop are set to 0.
 
     -------------------------------------------------------------------------------------
     Notes:
 
     """
 
-    try:
-        Xs = [crop.data["x0"][0], crop.data["x1"][0]]
-        Ys = [crop.data["y0"][0], crop.data["y1"][0]]
-        fxmin, fxmax = int(min(Xs)), int(max(Xs))
-        fymin, fymax = int(min(Ys)), int(max(Ys))
-        return frame[fymin:fymax, fxmin:fxmax]
-    except:
+    spec = CropSpec.from_crop(crop)
+    return frame if spec is None else spec.apply(frame)
+
+
+def crop_bounds(crop=None):
+    """
+    -------------------------------------------------------------------------------------
+
+    Converts `crop` specification to plain integer bounds
+
+    -------------------------------------------------------------------------------------
+    Args:
+        crop:: [CropSpec, hv.streams.stream, tuple, dict or str]
+            Crop specification, see `CropSpec.from_crop`. Set to None if no cropping
+            supplied. Bounds that were already converted are returned as they are.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        bounds:: [tuple]
+            (ymin, ymax, xmin, xmax) or None if no cropping supplied. For a polygon
+            these are the bounds of its bounding box.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Raises ValueError if `crop` cannot be interpreted, rather than silently
+          processing full frames.
+
+    """
+
+    if isinstance(crop, tuple):
+        return crop
+    spec = CropSpec.from_crop(crop)
+    return None if spec is None else spec.bounds
+
+
+@dataclass
+class CropSpec:
+    """
+    -------------------------------------------------------------------------------------
+
+    Plain, serializable crop: a box, or a polygon whose outside pixels are masked.
+    Coordinates refer to the (downsampled) frame shown by `LoadAndCrop`. A crop drawn
+    in a notebook can be saved with `CropSpec.from_crop(video_dict['crop']).save(path)`
+    and used in batch runs by setting `video_dict['crop']` to the path.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        bounds:: [tuple]
+            (ymin, ymax, xmin, xmax) of the box, or of the bounding box of the polygon
+
+        vertices:: [list]
+            (x, y) vertices of the polygon. None for a box.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Bounds are clipped to the frame, so a box dragged past the frame edge crops
+          up to the edge.
+
+    """
+
+    bounds: tuple
+    vertices: list = None
+    _masks: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.bounds = tuple(int(b) for b in self.bounds)
+        if len(self.bounds) != 4:
+            raise ValueError("crop bounds must be (ymin, ymax, xmin, xmax)")
+        ymin, ymax, xmin, xmax = self.bounds
+        if ymax <= max(ymin, 0) or xmax <= max(xmin, 0):
+            raise ValueError("crop {b} is empty".format(b=self.bounds))
+        if self.vertices is not None:
+            self.vertices = [(float(x), float(y)) for x, y in self.vertices]
+            if len(self.vertices) < 3:
+                raise ValueError("crop polygon needs at least 3 vertices")
+
+    @classmethod
+    def box(cls, x0, x1, y0, y1):
+        """Box crop from two corners."""
+        return cls((min(y0, y1), max(y0, y1), min(x0, x1), max(x0, x1)))
+
+    @classmethod
+    def polygon(cls, xs, ys):
+        """Polygon crop from vertex coordinates."""
+        bounds = (min(ys), max(ys), min(xs), max(xs))
+        return cls(bounds, list(zip(xs, ys)))
+
+    @classmethod
+    def from_crop(cls, crop):
+        """
+        Normalizes any supported crop specification to a CropSpec, or None:
+            None : no cropping
+            CropSpec : returned as is
+            tuple : (ymin, ymax, xmin, xmax) bounds
+            dict : as returned by `to_dict`
+            str : path of a file written by `save`
+            holoviews BoxEdit / PolyDraw stream : crop drawn in `LoadAndCrop`. No crop
+                                                  is returned if nothing was drawn.
+        """
+        if crop is None or isinstance(crop, cls):
+            return crop
+        if isinstance(crop, tuple):
+            return cls(crop)
+        if isinstance(crop, (str, os.PathLike)):
+            return cls.load(crop)
+        if isinstance(crop, dict):
+            return cls(crop["bounds"], crop.get("vertices"))
+        data = getattr(crop, "data", None)
+        if isinstance(data, dict):
+            if "x0" in data:
+                if len(data["x0"]) == 0:
+                    return None
+                x0, x1, y0, y1 = (data[k][0] for k in ("x0", "x1", "y0", "y1"))
+                return cls.box(x0, x1, y0, y1)
+            if "xs" in data:
+                if len(data["xs"]) == 0:
+                    return None
+                return cls.polygon(data["xs"][0], data["ys"][0])
+        raise ValueError("unsupported crop specification: {c!r}".format(c=crop))
+
+    def to_dict(self):
+        """JSON-serializable representation."""
+        return dict(bounds=list(self.bounds), vertices=self.vertices)
+
+    def save(self, path):
+        """Writes the crop as json to `path`."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a crop written by `save`."""
+        with open(path) as f:
+            return cls.from_crop(json.load(f))
+
+    def clip(self, height, width):
+        """Bounds clipped to a frame of `height` x `width` pixels."""
+        ymin, ymax, xmin, xmax = self.bounds
+        return (
+            min(max(ymin, 0), height),
+            min(max(ymax, 0), height),
+            min(max(xmin, 0), width),
+            min(max(xmax, 0), width),
+        )
+
+    def mask(self, height, width):
+        """uint8 mask (255 inside the polygon) of the cropped region of a frame of
+        `height` x `width` pixels. None for a box. Masks are cached per frame size."""
+        if self.vertices is None:
+            return None
+        if (height, width) not in self._masks:
+            ymin, ymax, xmin, xmax = self.clip(height, width)
+            mask = np.zeros((ymax - ymin, xmax - xmin), dtype=np.uint8)
+            points = np.round(np.array(self.vertices) - (xmin, ymin)).astype(np.int32)
+            cv2.fillPoly(mask, [points], 255)
+            self._masks[(height, width)] = mask
+        return self._masks[(height, width)]
+
+    def full_mask(self, height, width):
+        """uint8 mask (255 inside the box or polygon) of a whole frame of `height` x
+        `width` pixels."""
+        mask = np.zeros((height, width), dtype=np.uint8)
+        ymin, ymax, xmin, xmax = self.clip(height, width)
+        region = self.mask(height, width)
+        mask[ymin:ymax, xmin:xmax] = 255 if region is None else region
+        return mask
+
+    def bounding_box(self):
+        """Box crop of the bounds, i.e. without the polygon mask."""
+        return CropSpec(self.bounds)
+
+    def apply(self, frame):
+        """Crops `frame` (and masks it for a polygon)."""
+        height, width = frame.shape[:2]
+        ymin, ymax, xmin, xmax = self.clip(height, width)
+        frame = frame[ymin:ymax, xmin:xmax]
+        mask = self.mask(height, width)
+        if mask is not None:
+            frame = cv2.bitwise_and(frame, frame, mask=mask)
         return frame
 
 
@@ -431,12 +1070,15 @@ def Measure_Freezing(Motion, FreezeThresh, MinDuration=0):
     Args:
         Motion:: [numpy.array]
             Array containing number of pixels per frame whose intensity change from
-            previous frame exceeds `mt_cutoff`.
+            previous frame exceeds `mt_cutoff`. Frames run along the first axis, so the
+            (number of frames, N) motion of N regions of interest returned by
+            `Measure_Motion` is scored per region.
 
-        FreezeThresh:: [float]
+        FreezeThresh:: [float or array-like]
             Threshold value for determining magnitude of activity in `Motion` to designate
             frame as freezing/not freezing (i.e. if motion is below `FreezeThresh`, animal
-            is likely freezing).
+            is likely freezing). For motion of N regions, an array of N thresholds sets
+            a threshold per region.
 
         MinDuration:: [uint8]
             Duration for which `Motion` must be below `FreezeThresh` for freezing to be
@@ -446,32 +1088,26 @@ def Measure_Freezing(Motion, FreezeThresh, MinDuration=0):
     Returns:
         Freezing:: [numpy.array]
             Array defining whether animal is freezing on frame by frame basis.
-            0 = Not Freezing; 100 = Freezing
+            0 = Not Freezing; 100 = Freezing. Same shape as `Motion`.
 
     -------------------------------------------------------------------------------------
     Notes:
         - Although Motion argument is often `Motion` array returned by function
-          `Measure_Motion`, any unidimensional array could be passed.
+          `Measure_Motion`, any array with frames along its first axis could be passed.
 
     """
 
-    # Find frames below thresh
-    BelowThresh = (Motion < FreezeThresh).astype(int)
-
-    # Perform local cumulative thresh detection
-    # For each consecutive frame motion is below threshold count is increased by 1 until motion goes above thresh,
-    # at which point coint is set back to 0
-    CumThresh = np.zeros(len(Motion))
-    for x in range(1, len(Motion)):
-        if BelowThresh[x] == 1:
-            CumThresh[x] = CumThresh[x - 1] + BelowThresh[x]
-
-    # Define periods where motion is below thresh for minduration as freezing
-    Freezing = (CumThresh >= MinDuration).astype(int)
-    for x in range(len(Freezing) - 2, -1, -1):
-        if Freezing[x] == 0 and Freezing[x + 1] > 0 and Freezing[x + 1] < MinDuration:
-            Freezing[x] = Freezing[x + 1] + 1
-    Freezing = (Freezing > 0).astype(int)
+    # Find frames below thresh. The first frame never counts towards a freezing bout.
+    BelowThresh = np.asarray(Motion) < FreezeThresh
+    BelowThresh[:1] = False
+
+    # Periods where motion is below thresh for at least MinDuration frames are freezing,
+    # from their first frame on. With MinDuration <= 0 every frame is freezing.
+    if MinDuration <= 0:
+        Freezing = np.ones(BelowThresh.shape, dtype=int)
+    else:
+        RunLength = np.moveaxis(run_lengths(np.moveaxis(BelowThresh, 0, -1)), -1, 0)
+        Freezing = (BelowThresh & (RunLength >= MinDuration)).astype(int)
     Freezing = Freezing * 100  # Convert to Percentage
 
     return Freezing
@@ -480,6 +1116,94 @@ def Measure_Freezing(Motion, FreezeThresh, MinDuration=0):
 ########################################################################################
 
 
+def Measure_Freezing_Sweep(Motion, FreezeThresh, MinDuration):
+    """
+    -------------------------------------------------------------------------------------
+
+    Calculates freezing on a frame by frame basis for every combination of a set of
+    freezing thresholds and minimum durations, in a single pass over `Motion`.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`.
+
+        FreezeThresh:: [array-like]
+            Threshold values for determining magnitude of activity in `Motion` to
+            designate frame as freezing/not freezing.
+
+        MinDuration:: [array-like]
+            Durations for which `Motion` must be below `FreezeThresh` for freezing to be
+            registered.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        Freezing:: [numpy.array]
+            uint8 array of shape (len(FreezeThresh), len(MinDuration), len(Motion)).
+            `Freezing[i, j]` is `Measure_Freezing(Motion, FreezeThresh[i],
+            MinDuration[j])`. 0 = Not Freezing; 100 = Freezing
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Percent freezing of every combination is `Freezing.mean(axis=-1)`.
+
+    """
+
+    Motion = np.asarray(Motion)
+    FreezeThresh = np.atleast_1d(FreezeThresh)
+    MinDuration = np.atleast_1d(MinDuration)
+
+    # Frames below each thresh and the length of the bout each frame belongs to
+    BelowThresh = Motion[np.newaxis, :] < FreezeThresh[:, np.newaxis]
+    BelowThresh[:, :1] = False
+    RunLength = run_lengths(BelowThresh)
+
+    # Score every minimum duration from the same bouts
+    Freezing = BelowThresh[:, np.newaxis, :] & (
+        RunLength[:, np.newaxis, :] >= MinDuration[np.newaxis, :, np.newaxis]
+    )
+    Freezing |= (MinDuration <= 0)[np.newaxis, :, np.newaxis]
+    return Freezing.astype(np.uint8) * np.uint8(100)
+
+
+def run_lengths(mask):
+    """
+    -------------------------------------------------------------------------------------
+
+    Run-length encoding of a boolean array along its last axis.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        mask:: [numpy.array]
+            Boolean array.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        lengths:: [numpy.array]
+            Array of the same shape as `mask`. Each True element holds the length of
+            the run of consecutive True elements it belongs to, False elements are 0.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    mask = np.asarray(mask, dtype=bool)
+    # Pad every row with False so that runs never continue into the next row
+    padded = np.zeros(mask.shape[:-1] + (mask.shape[-1] + 2,), dtype=bool)
+    padded[..., 1:-1] = mask
+    flat = padded.ravel()
+    edges = np.diff(flat.view(np.int8))
+    lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    out = np.zeros(padded.shape, dtype=np.intp)
+    out.ravel()[flat] = np.repeat(lengths, lengths)
+    return out[..., 1:-1]
+
+
+########################################################################################
+
+
 def PlayVideo(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
     """
     -------------------------------------------------------------------------------------
@@ -526,10 +1250,10 @@ def PlayVideo(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
             Threshold value for determining magnitude of change sufficient to mark
             pixel as changing from prior frame.
 
-        crop:: [holoviews.streams.stream]
+        crop:: [holoviews.streams.stream or CropSpec]
             Holoviews stream object enabling dynamic selection in response to
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+            cropping tool, a CropSpec or the path of a saved CropSpec (see
+            `CropSpec.from_crop`). Set to None if no cropping supplied.
 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to
@@ -545,84 +1269,72 @@ def PlayVideo(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
     """
 
     # Upoad file
-    cap = cv2.VideoCapture(video_dict["fpath"])
-    cap.set(cv2.CAP_PROP_POS_FRAMES, video_dict["start"] + display_dict["start"])
-
-    # set text parameters
-    textfont = cv2.FONT_HERSHEY_SIMPLEX
-    textposition = (10, 30)
-    textfontscale = 1
-    textlinetype = 2
-    textfontcolor = 255
-
-    # Initialize first frame
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    if video_dict["dsmpl"] < 1:
-        frame_new = cv2.resize(
-            frame_new,
-            (
-                int(frame_new.shape[1] * video_dict["dsmpl"]),
-                int(frame_new.shape[0] * video_dict["dsmpl"]),
-            ),
-            cv2.INTER_NEAREST,
-        )
-    frame_new = cropframe(frame_new, video_dict.get("crop"))
-    frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
+    with FrameSource(
+        video_dict["fpath"],
+        video_dict["start"] + display_dict["start"],
+        video_dict["start"] + display_dict["end"],
+        video_dict["dsmpl"],
+        CropSpec.from_crop(video_dict.get("crop")),
+    ) as frames:
+        # set text parameters
+        textfont = cv2.FONT_HERSHEY_SIMPLEX
+        textposition = (10, 30)
+        textfontscale = 1
+        textlinetype = 2
+        textfontcolor = 255
+
+        # Initialize first frame
+        ret, frame_new = frames.read()
+        frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
+
+        # Initialize video storage if desired
+        if display_dict["save_video"]:
+            width, height = int(frame_new.shape[1]), int(frame_new.shape[0] * 2)
+            fourcc = 0
+            writer = cv2.VideoWriter(
+                os.path.join(
+                    os.path.normpath(video_dict["dpath"]), "video_output.avi"
+                ),
+                fourcc,
+                20.0,
+                (width, height),
+                isColor=False,
+            )
 
-    # Initialize video storage if desired
-    if display_dict["save_video"]:
-        width, height = int(frame_new.shape[1]), int(frame_new.shape[0] * 2)
-        fourcc = 0
-        writer = cv2.VideoWriter(
-            os.path.join(os.path.normpath(video_dict["dpath"]), "video_output.avi"),
-            fourcc,
-            20.0,
-            (width, height),
-            isColor=False,
-        )
+        # Loop through frames to detect frame by frame differences
+        for x in range(display_dict["start"] + 1, display_dict["end"]):
+            # Attempt to load next frame
+            frame_old = frame_new
+            ret, frame_new = frames.read()
+            if ret:
+                # process frame
+                frame_new = cv2.GaussianBlur(
+                    frame_new.astype("float"), (0, 0), SIGMA
+                )
+                frame_dif = np.absolute(frame_new - frame_old)
+                frame_cut = (frame_dif > mt_cutoff).astype("uint8") * 255
 
-    # Loop through frames to detect frame by frame differences
-    for x in range(display_dict["start"] + 1, display_dict["end"]):
-        # Attempt to load next frame
-        frame_old = frame_new
-        ret, frame_new = cap.read()
-        if ret:
-            # process frame
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            if video_dict["dsmpl"] < 1:
-                frame_new = cv2.resize(
+                # Add text to videos, display and save
+                texttext = "FREEZING" if Freezing[x] == 100 else "ACTIVE"
+                cv2.putText(
                     frame_new,
-                    (
-                        int(frame_new.shape[1] * video_dict["dsmpl"]),
-                        int(frame_new.shape[0] * video_dict["dsmpl"]),
-                    ),
-                    cv2.INTER_NEAREST,
+                    texttext,
+                    textposition,
+                    textfont,
+                    textfontscale,
+                    textfontcolor,
+                    textlinetype,
                 )
-            frame_new = cropframe(frame_new, video_dict.get("crop"))
-            frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype("uint8") * 255
-
-            # Add text to videos, display and save
-            texttext = "FREEZING" if Freezing[x] == 100 else "ACTIVE"
-            cv2.putText(
-                frame_new,
-                texttext,
-                textposition,
-                textfont,
-                textfontscale,
-                textfontcolor,
-                textlinetype,
-            )
-            display = np.concatenate((frame_new.astype("uint8"), frame_cut))
-            display_image(display, display_dict["fps"], display_dict["resize"])
-            if display_dict["save_video"]:
-                writer.write(display)
-
-        else:
-            print("No frame detected at frame : " + str(x) + ".Stopping video play")
-            break
+                display = np.concatenate((frame_new.astype("uint8"), frame_cut))
+                display_image(display, display_dict["fps"], display_dict["resize"])
+                if display_dict["save_video"]:
+                    writer.write(display)
+
+            else:
+                print(
+                    "No frame detected at frame : " + str(x) + ".Stopping video play"
+                )
+                break
 
     # Close video window and video writer if open
     print("Done playing segment")
@@ -631,6 +1343,10 @@ def PlayVideo(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
 
 
 def display_image(frame, fps, resize):
+    import PIL.Image
+    from io import BytesIO
+    from IPython.display import clear_output, Image, display
+
     img = PIL.Image.fromarray(frame, "L")
     img = img.resize(size=resize) if resize else img
     buffer = BytesIO()
@@ -692,10 +1408,10 @@ def PlayVideo_ext(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
             Threshold value for determining magnitude of change sufficient to mark
             pixel as changing from prior frame.
 
-        crop:: [holoviews.streams.stream]
+        crop:: [holoviews.streams.stream or CropSpec]
             Holoviews stream object enabling dynamic selection in response to
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+            cropping tool, a CropSpec or the path of a saved CropSpec (see
+            `CropSpec.from_crop`). Set to None if no cropping supplied.
 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to
@@ -711,92 +1427,80 @@ def PlayVideo_ext(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
     """
 
     # Upoad file
-    cap = cv2.VideoCapture(video_dict["fpath"])
     rate = int(
         1000 / display_dict["fps"]
     )  # duration each frame is present for, in milliseconds
-    cap.set(cv2.CAP_PROP_POS_FRAMES, video_dict["start"] + display_dict["start"])
-
-    # set text parameters
-    textfont = cv2.FONT_HERSHEY_SIMPLEX
-    textposition = (10, 30)
-    textfontscale = 1
-    textlinetype = 2
-    textfontcolor = 255
-
-    # Initialize first frame
-    ret, frame_new = cap.read()
-    frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-    if video_dict["dsmpl"] < 1:
-        frame_new = cv2.resize(
-            frame_new,
-            (
-                int(frame_new.shape[1] * video_dict["dsmpl"]),
-                int(frame_new.shape[0] * video_dict["dsmpl"]),
-            ),
-            cv2.INTER_NEAREST,
-        )
-    frame_new = cropframe(frame_new, video_dict.get("crop"))
-    frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
+    with FrameSource(
+        video_dict["fpath"],
+        video_dict["start"] + display_dict["start"],
+        video_dict["start"] + display_dict["end"],
+        video_dict["dsmpl"],
+        CropSpec.from_crop(video_dict.get("crop")),
+    ) as frames:
+        # set text parameters
+        textfont = cv2.FONT_HERSHEY_SIMPLEX
+        textposition = (10, 30)
+        textfontscale = 1
+        textlinetype = 2
+        textfontcolor = 255
+
+        # Initialize first frame
+        ret, frame_new = frames.read()
+        frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
+
+        # Initialize video storage if desired
+        if display_dict["save_video"]:
+            width, height = int(frame_new.shape[1]), int(frame_new.shape[0])
+            fourcc = 0
+            writer = cv2.VideoWriter(
+                os.path.join(
+                    os.path.normpath(video_dict["dpath"]), "video_output.avi"
+                ),
+                fourcc,
+                20.0,
+                (width, height),
+                isColor=False,
+            )
 
-    # Initialize video storage if desired
-    if display_dict["save_video"]:
-        width, height = int(frame_new.shape[1]), int(frame_new.shape[0])
-        fourcc = 0
-        writer = cv2.VideoWriter(
-            os.path.join(os.path.normpath(video_dict["dpath"]), "video_output.avi"),
-            fourcc,
-            20.0,
-            (width, height),
-            isColor=False,
-        )
+        # Loop through frames to detect frame by frame differences
+        for x in range(display_dict["start"] + 1, display_dict["end"]):
+            # press 'q' to exit
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+            # Attempt to load next frame
+            frame_old = frame_new
+            ret, frame_new = frames.read()
+            if ret:
+                # process frame
+                frame_new = cv2.GaussianBlur(
+                    frame_new.astype("float"), (0, 0), SIGMA
+                )
+                frame_dif = np.absolute(frame_new - frame_old)
+                frame_cut = (frame_dif > mt_cutoff).astype("uint8") * 255
 
-    # Loop through frames to detect frame by frame differences
-    for x in range(display_dict["start"] + 1, display_dict["end"]):
-        # press 'q' to exit
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
-
-        # Attempt to load next frame
-        frame_old = frame_new
-        ret, frame_new = cap.read()
-        if ret:
-            # process frame
-            frame_new = cv2.cvtColor(frame_new, cv2.COLOR_BGR2GRAY)
-            if video_dict["dsmpl"] < 1:
-                frame_new = cv2.resize(
+                # Add text to videos, display and save
+                texttext = "FREEZING" if Freezing[x] == 100 else "ACTIVE"
+                cv2.putText(
                     frame_new,
-                    (
-                        int(frame_new.shape[1] * video_dict["dsmpl"]),
-                        int(frame_new.shape[0] * video_dict["dsmpl"]),
-                    ),
-                    cv2.INTER_NEAREST,
+                    texttext,
+                    textposition,
+                    textfont,
+                    textfontscale,
+                    textfontcolor,
+                    textlinetype,
                 )
-            frame_new = cropframe(frame_new, video_dict.get("crop"))
-            frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-            frame_dif = np.absolute(frame_new - frame_old)
-            frame_cut = (frame_dif > mt_cutoff).astype("uint8") * 255
-
-            # Add text to videos, display and save
-            texttext = "FREEZING" if Freezing[x] == 100 else "ACTIVE"
-            cv2.putText(
-                frame_new,
-                texttext,
-                textposition,
-                textfont,
-                textfontscale,
-                textfontcolor,
-                textlinetype,
-            )
-            display = np.concatenate((frame_new.astype("uint8"), frame_cut))
-            cv2.imshow("preview", display)
-            cv2.waitKey(rate)
-            if display_dict["save_video"]:
-                writer.write(display)
-
-        else:
-            print("No frame detected at frame : " + str(x) + ".Stopping video play")
-            break
+                display = np.concatenate((frame_new.astype("uint8"), frame_cut))
+                cv2.imshow("preview", display)
+                cv2.waitKey(rate)
+                if display_dict["save_video"]:
+                    writer.write(display)
+
+            else:
+                print(
+                    "No frame detected at frame : " + str(x) + ".Stopping video play"
+                )
+                break
 
     # Close video window and video writer if open
     cv2.destroyAllWindows()
@@ -808,11 +1512,20 @@ def PlayVideo_ext(video_dict, display_dict, Freezing, mt_cutoff, SIGMA=1):
 ########################################################################################
 
 
-def SaveData(video_dict, Motion, Freezing, mt_cutoff, FreezeThresh, MinDuration):
+def SaveData(
+    video_dict,
+    Motion,
+    Freezing,
+    mt_cutoff,
+    FreezeThresh,
+    MinDuration,
+    file_format="csv",
+):
     """
     -------------------------------------------------------------------------------------
 
-    Saves frame by frame data for motion and freezing to .csv file
+    Saves frame by frame data for motion and freezing to .csv file, or to a compact
+    binary .npz file
 
     -------------------------------------------------------------------------------------
     Args:
@@ -858,16 +1571,46 @@ def SaveData(video_dict, Motion, Freezing, mt_cutoff, FreezeThresh, MinDuration)
             Duration for which `Motion` must be below `FreezeThresh` for freezing to be
             registered.
 
+        file_format:: [str]
+            'csv' : one row per frame with the parameters repeated on every row,
+                    saved as <video>_FreezingOutput.csv
+            'npz' : Motion as uint32 array, Freezing as freezing epochs (see
+                    `freeze_epochs`) and the parameters once as metadata, in a
+                    compressed <video>_FreezingOutput.npz. Read back with `LoadData`.
+
     -------------------------------------------------------------------------------------
     Returns:
-        Nothing returned
+        path:: [str]
+            Path of the saved file.
 
     -------------------------------------------------------------------------------------
     Notes:
-
+        - Multi-region motion (see `Measure_Motion`) can only be saved as 'npz'.
 
     """
 
+    if file_format == "npz":
+        path = os.path.splitext(video_dict["fpath"])[0] + "_FreezingOutput.npz"
+        metadata = dict(
+            File=video_dict["file"],
+            MotionCutoff=np.asarray(mt_cutoff).tolist(),
+            FreezeThresh=np.asarray(FreezeThresh).tolist(),
+            MinFreezeDuration=np.asarray(MinDuration).tolist(),
+            shape=list(np.shape(Freezing)),
+            version=_OUTPUT_VERSION,
+        )
+        np.savez_compressed(
+            path,
+            Motion=np.rint(Motion).astype(np.uint32),
+            epochs=freeze_epochs(Freezing),
+            metadata=np.array(json.dumps(metadata)),
+        )
+        return path
+    if file_format != "csv":
+        raise ValueError(
+            "file_format must be 'csv' or 'npz', not {f}".format(f=file_format)
+        )
+
     # Create Dataframe
     DataFrame = pd.DataFrame(
         {
@@ -881,16 +1624,171 @@ def SaveData(video_dict, Motion, Freezing, mt_cutoff, FreezeThresh, MinDuration)
         }
     )
 
-    DataFrame.to_csv(
-        os.path.splitext(video_dict["fpath"])[0] + "_FreezingOutput.csv", index=False
+    path = os.path.splitext(video_dict["fpath"])[0] + "_FreezingOutput.csv"
+    DataFrame.to_csv(path, index=False)
+    return path
+
+
+def LoadData(path, as_frame=False):
+    """
+    -------------------------------------------------------------------------------------
+
+    Loads frame by frame data saved by `SaveData`
+
+    -------------------------------------------------------------------------------------
+    Args:
+        path:: [str]
+            Path of a _FreezingOutput.npz or _FreezingOutput.csv file.
+
+        as_frame:: [bool]
+            Whether to return the per-frame dataframe written by `SaveData` as csv
+            instead of arrays.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        Motion:: [numpy.array]
+            Array containing number of pixels per frame whose intensity change from
+            previous frame exceeds `mt_cutoff`.
+
+        Freezing:: [numpy.array]
+            Array defining whether animal is freezing on frame by frame basis,
+            rebuilt from the saved freezing epochs. 0 = Not Freezing; 100 = Freezing
+
+        metadata:: [dict]
+            'File', 'MotionCutoff', 'FreezeThresh' and 'MinFreezeDuration'.
+
+        or, if `as_frame` is True:
+
+        DataFrame:: [pandas.dataframe]
+            One row per frame with the columns 'File', 'MotionCutoff', 'FreezeThresh',
+            'MinFreezeDuration', 'Frame', 'Motion' and 'Freezing'.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    if os.path.splitext(path)[1] == ".csv":
+        DataFrame = pd.read_csv(path)
+        if as_frame:
+            return DataFrame
+        metadata = {
+            key: DataFrame[key].iloc[0] if len(DataFrame) else None
+            for key in ("File", "MotionCutoff", "FreezeThresh", "MinFreezeDuration")
+        }
+        return (
+            DataFrame["Motion"].to_numpy(),
+            DataFrame["Freezing"].to_numpy(),
+            metadata,
+        )
+
+    with np.load(path) as npz:
+        metadata = json.loads(str(npz["metadata"]))
+        Motion = npz["Motion"]
+        epochs = npz["epochs"]
+    shape = tuple(metadata.pop("shape"))
+    metadata.pop("version")
+    Freezing = epochs_to_freezing(epochs, shape)
+    if not as_frame:
+        return Motion, Freezing, metadata
+    if len(shape) > 1:
+        raise ValueError("as_frame requires single-region output")
+    n_frames = len(Motion)
+    return pd.DataFrame(
+        {
+            "File": [metadata["File"]] * n_frames,
+            "MotionCutoff": float(metadata["MotionCutoff"]),
+            "FreezeThresh": float(metadata["FreezeThresh"]),
+            "MinFreezeDuration": float(metadata["MinFreezeDuration"]),
+            "Frame": np.arange(n_frames),
+            "Motion": Motion.astype(float),
+            "Freezing": Freezing,
+        }
     )
 
 
+def freeze_epochs(Freezing):
+    """
+    -------------------------------------------------------------------------------------
+
+    Run-length encodes freezing into freezing epochs
+
+    -------------------------------------------------------------------------------------
+    Args:
+        Freezing:: [numpy.array]
+            Array defining whether animal is freezing on frame by frame basis, with
+            frames along the first axis. 0 = Not Freezing; 100 = Freezing
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        epochs:: [numpy.array]
+            int64 array of shape (number of epochs, 3). Every row is (column, start,
+            end) of a freezing epoch: the flat index of the region (0 for
+            one-dimensional `Freezing`), its first frame and the frame after its last.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    Freezing = np.asarray(Freezing)
+    columns = (Freezing > 0).reshape(len(Freezing), -1).T
+    padded = np.zeros((len(columns), len(Freezing) + 2), dtype=bool)
+    padded[:, 1:-1] = columns
+    edges = np.diff(padded.view(np.int8), axis=1)
+    column, start = np.nonzero(edges == 1)
+    end = np.nonzero(edges == -1)[1]
+    return np.stack([column, start, end], axis=1).astype(np.int64)
+
+
+def epochs_to_freezing(epochs, shape):
+    """
+    -------------------------------------------------------------------------------------
+
+    Rebuilds frame by frame freezing from freezing epochs
+
+    -------------------------------------------------------------------------------------
+    Args:
+        epochs:: [numpy.array]
+            Freezing epochs as returned by `freeze_epochs`.
+
+        shape:: [int or tuple]
+            Shape of the frame by frame freezing, e.g. the number of frames.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        Freezing:: [numpy.array]
+            Array defining whether animal is freezing on frame by frame basis.
+            0 = Not Freezing; 100 = Freezing
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    shape = tuple(np.atleast_1d(shape))
+    n_frames, n_columns = shape[0], int(np.prod(shape[1:], dtype=int))
+    changes = np.zeros((n_columns, n_frames + 1), dtype=np.int64)
+    epochs = np.asarray(epochs, dtype=np.int64).reshape(-1, 3)
+    np.add.at(changes, (epochs[:, 0], epochs[:, 1]), 1)
+    np.add.at(changes, (epochs[:, 0], epochs[:, 2]), -1)
+    Freezing = (np.cumsum(changes[:, :-1], axis=1) > 0).astype(int) * 100
+    return Freezing.T.reshape(shape)
+
+
 ########################################################################################
 
 
 def Summarize(
-    video_dict, Motion, Freezing, FreezeThresh, MinDuration, mt_cutoff, bin_dict=None
+    video_dict,
+    Motion,
+    Freezing,
+    FreezeThresh,
+    MinDuration,
+    mt_cutoff,
+    bin_dict=None,
+    roi_names=None,
+    units="frames",
 ):
     """
     -------------------------------------------------------------------------------------
@@ -922,15 +1820,16 @@ def Summarize(
 
         Motion:: [numpy.array]
             Array containing number of pixels per frame whose intensity change from
-            previous frame exceeds `mt_cutoff`.
+            previous frame exceeds `mt_cutoff`. May be (number of frames, N) for N
+            regions of interest (see `Measure_Motion`).
 
         Freezing:: [numpy.array]
             Array defining whether animal is freezing on frame by frame basis.
-            0 = Not Freezing; 100 = Freezing
+            0 = Not Freezing; 100 = Freezing. Same shape as `Motion`.
 
-        FreezeThresh:: [float]
+        FreezeThresh:: [float or array-like]
             Threshold value for determining magnitude of activity in `Motion` to designate
-            frame as freezing/not freezing.
+            frame as freezing/not freezing. One per region for motion of N regions.
 
         MinDuration:: [uint8]
             Duration for which `Motion` must be below `FreezeThresh` for freezing to be
@@ -943,15 +1842,25 @@ def Summarize(
         bin_dict:: [dict]
             Dictionary specifying bins.  Dictionary keys should be names of the bins.
             Dictionary value for each bin should be a tuple, with the start and end of
-            the bin, in seconds, relative to the start of the analysis period
+            the bin, in `units`, relative to the start of the analysis period
             (i.e. if start frame is 100, it will be relative to that). If no bins are to
             be specified, set bin_dict = None.
             example = bin_dict = {1:(0,100), 2:(100,200)}
 
+        roi_names:: [list]
+            Names of the regions of interest, for motion of N regions. Defaults to
+            0..N-1.
+
+        units:: [str]
+            Units of the bins in `bin_dict`: 'frames' or 'seconds'. Seconds are
+            converted to frames with video_dict['fps'].
+
     -------------------------------------------------------------------------------------
     Returns:
         df:: [pandas.dataframe]
-            Returns pandas dataframe with binned summary information.
+            Returns pandas dataframe with binned summary information. For motion of N
+            regions, the rows of every region follow each other and an 'ROI' column
+            names the region.
 
     -------------------------------------------------------------------------------------
     Notes:
@@ -959,39 +1868,224 @@ def Summarize(
 
     """
 
-    # define bins
-    avg_dict = {"all": (0, len(Motion))}
-    bin_dict = bin_dict if bin_dict is not None else avg_dict
-    # bin_dict = {k: tuple((np.array(v) * video_dict['fps']).tolist()) for k, v in bin_dict.items()}
-
-    # get means
-    bins = (
-        pd.Series(bin_dict)
-        .rename("range(f)")
-        .reset_index()
-        .rename(columns=dict(index="bin"))
-    )
-    bins["Motion"] = bins["range(f)"].apply(
-        lambda rng: Motion[slice(rng[0], rng[1])].mean()
-    )
-    bins["Freezing"] = bins["range(f)"].apply(
-        lambda rng: Freezing[slice(rng[0], rng[1])].mean()
+    # bin means of every region at once
+    Motion, Freezing = np.asarray(Motion), np.asarray(Freezing)
+    names, ranges = _bin_ranges(bin_dict, len(Motion), video_dict.get("fps"), units)
+    motion, freezing = bin_means(Motion, ranges), bin_means(Freezing, ranges)
+
+    # One row per region and bin, regions after each other
+    n_rois = 1 if Motion.ndim == 1 else Motion.shape[1]
+    df = pd.DataFrame(
+        {
+            "File": video_dict["file"],
+            "FileLength": float(len(Motion)),
+            "MotionCutoff": np.float64(mt_cutoff),
+            "FreezeThresh": np.repeat(
+                np.broadcast_to(np.asarray(FreezeThresh, dtype=float), n_rois),
+                len(names),
+            ),
+            "MinFreezeDuration": np.float64(MinDuration),
+            "bin": names * n_rois,
+            "range(f)": pd.Series(list(map(tuple, ranges)) * n_rois, dtype=object),
+            "Motion": motion.T.ravel(),
+            "Freezing": freezing.T.ravel(),
+        }
     )
+    if Motion.ndim == 2:
+        roi_names = range(n_rois) if roi_names is None else roi_names
+        df.insert(1, "ROI", np.repeat(list(roi_names), len(names)))
+    return df
+
+
+def Summarize_Files(
+    video_dict,
+    Motion,
+    Freezing,
+    FreezeThresh,
+    MinDuration,
+    mt_cutoff,
+    bin_dict=None,
+    FileLengths=None,
+    units="frames",
+):
+    """
+    -------------------------------------------------------------------------------------
+
+    Generate binned summary report of freezing and motion for many files at once. Same
+    as `Summarize` for every file, concatenated, but all bin means of all files are
+    computed together from one cumulative sum.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        video_dict:: [dict]
+            Dictionary with the following keys:
+                'FileNames' : List of filenames of the files, one per column of
+                              `Motion`. [list]
+                'fps' : frames per second of video files (only if `units` is
+                        'seconds') [int]
+
+        Motion:: [numpy.array]
+            Motion of every file stacked as columns, shape (number of frames,
+            number of files). Files shorter than the longest one are padded at the
+            end (with any value) and their lengths given in `FileLengths`.
+
+        Freezing:: [numpy.array]
+            Freezing of every file, same shape as `Motion`.
+
+        FreezeThresh:: [float]
+            Threshold value for determining magnitude of activity in `Motion` to designate
+            frame as freezing/not freezing.
+
+        MinDuration:: [uint8]
+            Duration for which `Motion` must be below `FreezeThresh` for freezing to be
+            registered.
+
+        mt_cutoff:: [float]
+            Threshold value for determining magnitude of change sufficient to mark
+            pixel as changing from prior frame.
+
+        bin_dict:: [dict]
+            Dictionary specifying bins, see `Summarize`. If None, session averages are
+            returned.
+
+        FileLengths:: [array-like]
+            Number of frames of every file. Defaults to the number of rows of `Motion`
+            for every file. Bins are clipped to the length of each file.
+
+        units:: [str]
+            Units of the bins in `bin_dict`: 'frames' or 'seconds'.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        df:: [pandas.dataframe]
+            Returns pandas dataframe with binned summary information, with the rows of
+            every file after each other, in the order of video_dict['FileNames'].
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Without `bin_dict`, the 'all' bin of each file covers the whole file, as in
+          `Summarize`.
+
+    """
+
+    Motion, Freezing = np.asarray(Motion), np.asarray(Freezing)
+    n_files = Motion.shape[1]
+    if FileLengths is None:
+        FileLengths = np.full(n_files, len(Motion))
+    FileLengths = np.asarray(FileLengths)
+    names, ranges = _bin_ranges(bin_dict, len(Motion), video_dict.get("fps"), units)
+    motion = bin_means(Motion, ranges, FileLengths)
+    freezing = bin_means(Freezing, ranges, FileLengths)
+    if bin_dict is None:
+        ranges = np.stack([np.zeros(n_files, dtype=int), FileLengths], axis=1)
+    else:
+        ranges = np.broadcast_to(ranges, (n_files,) + ranges.shape).reshape(-1, 2)
 
-    # Create data frame to store data in
+    # One row per file and bin, files after each other
     df = pd.DataFrame(
         {
-            "File": [video_dict["file"]] * len(bins),
-            "FileLength": np.ones(len(bins)) * len(Motion),
-            "MotionCutoff": np.ones(len(bins)) * mt_cutoff,
-            "FreezeThresh": np.ones(len(bins)) * FreezeThresh,
-            "MinFreezeDuration": np.ones(len(bins)) * MinDuration,
+            "File": np.repeat(list(video_dict["FileNames"]), len(names)),
+            "FileLength": np.repeat(FileLengths.astype(float), len(names)),
+            "MotionCutoff": np.float64(mt_cutoff),
+            "FreezeThresh": np.float64(FreezeThresh),
+            "MinFreezeDuration": np.float64(MinDuration),
+            "bin": names * n_files,
+            "range(f)": pd.Series(list(map(tuple, ranges.tolist())), dtype=object),
+            "Motion": motion.T.ravel(),
+            "Freezing": freezing.T.ravel(),
         }
     )
-    df = pd.concat([df, bins], axis=1)
     return df
 
 
+def bin_means(values, ranges, lengths=None):
+    """
+    -------------------------------------------------------------------------------------
+
+    Means of `values` over bins of frames. All bins are computed at once from the
+    cumulative sum of `values`, so the cost does not depend on the number or the width
+    of the bins.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        values:: [numpy.array]
+            Values with frames along the first axis, e.g. `Motion` or `Freezing` of a
+            file, of N regions (number of frames, N) or of stacked files (number of
+            frames, number of files).
+
+        ranges:: [numpy.array]
+            (number of bins, 2) array of start and end frame of every bin. As with
+            slices, the end frame is excluded, negative frames count from the end and
+            bins are clipped to the frames.
+
+        lengths:: [array-like]
+            Number of valid frames of every column of `values`, if columns are files
+            of different length padded at the end. Bins are clipped to them.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        means:: [numpy.array]
+            Array of shape (number of bins,) + values.shape[1:]. Empty bins are NaN.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    cumulative = np.zeros((len(values) + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=cumulative[1:])
+
+    # bin edges per column, as slices of the valid frames of that column
+    shape = (len(ranges),) + values.shape[1:]
+    edge = (-1, 2) + (1,) * (values.ndim - 1)
+    limit = len(values) if lengths is None else np.minimum(lengths, len(values))
+    start, stop = _slice_bounds(ranges.reshape(edge), limit)
+    start = np.broadcast_to(start, shape)
+    stop = np.broadcast_to(stop, shape)
+    total = np.take_along_axis(cumulative, stop, 0)
+    total -= np.take_along_axis(cumulative, start, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / (stop - start)
+
+
+def _slice_bounds(ranges, limit):
+    """Start and stop of the slices `ranges[:, 0]:ranges[:, 1]` of `limit` frames, as
+    `slice(start, stop).indices(limit)` gives them, for arrays of ranges and limits."""
+    bounds = np.where(ranges < 0, ranges + limit, ranges)
+    start = np.clip(bounds[:, 0], 0, limit)
+    stop = np.clip(bounds[:, 1], start, limit)
+    return start, stop
+
+
+def _bin_ranges(bin_dict, n_frames, fps=None, units="frames"):
+    """Names and (number of bins, 2) frame ranges of the bins of `bin_dict`, or of a
+    single bin 'all' over all `n_frames` frames if `bin_dict` is None. Bins keep the
+    meaning of slices: an open (None) start or end stands for the first or last frame
+    and negative frames, left for `bin_means`, count from the end."""
+    if bin_dict is None:
+        return ["all"], np.array([[0, n_frames]])
+    if units not in ("frames", "seconds"):
+        raise ValueError("units must be 'frames' or 'seconds', not {u}".format(u=units))
+    ranges = []
+    for name, rng in bin_dict.items():
+        start, stop = rng
+        if units == "seconds":
+            start = None if start is None else start * fps
+            stop = None if stop is None else stop * fps
+        try:
+            start = 0 if start is None else int(np.round(start))
+            stop = n_frames if stop is None else int(np.round(stop))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(
+                "Bin {n} must be a (start, end) pair of frames, seconds or None, "
+                "not {r}".format(n=name, r=rng)
+            )
+        ranges.append((start, stop))
+    return list(bin_dict.keys()), np.array(ranges, dtype=int).reshape(-1, 2)
+
+
 ########################################################################################
 
 
@@ -1077,6 +2171,8 @@ def Batch(
     MinDuration,
     SIGMA=1,
     accept_p_frames=False,
+    n_workers=1,
+    file_format="csv",
 ):
     """
     -------------------------------------------------------------------------------------
@@ -1125,10 +2221,10 @@ def Batch(
             Duration for which `Motion` must be below `FreezeThresh` for freezing to be
             registered.
 
-        crop:: [holoviews.streams.stream]
+        crop:: [holoviews.streams.stream or CropSpec]
             Holoviews stream object enabling dynamic selection in response to
-            cropping tool. `crop.data` contains x and y coordinates of crop
-            boundary vertices. Set to None if no cropping supplied.
+            cropping tool, a CropSpec or the path of a saved CropSpec (see
+            `CropSpec.from_crop`). Set to None if no cropping supplied.
 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to
@@ -1138,6 +2234,15 @@ def Batch(
             Dictates whether to allow videos with temporal compresssion.  Currenntly, if
             more than 1/100 frames returns false, error is flagged.
 
+        n_workers:: [int]
+            Number of processes. If larger than 1, each video is analyzed in a
+            separate process and its _FreezingOutput.csv is written as soon as it is
+            done.
+
+        file_format:: [str]
+            Format of the frame by frame output of every video, 'csv' or 'npz'. See
+            `SaveData`.
+
 
     -------------------------------------------------------------------------------------
     Returns:
@@ -1148,53 +2253,55 @@ def Batch(
 
     -------------------------------------------------------------------------------------
     Notes:
+        A video that cannot be analyzed does not stop the batch. Failures are printed
+        at the end and stored in `summary_all.attrs["failed"]` as a dictionary of
+        file name to error message. Rows of `summary_all` follow the order of
+        `video_dict['FileNames']`.
 
     """
 
-    # Loop through files
-    for video_dict["file"] in video_dict["FileNames"]:
-        # Set file
-        print("Processing File: {f}".format(f=video_dict["file"]))
-        video_dict["fpath"] = os.path.join(
-            os.path.normpath(video_dict["dpath"]), video_dict["file"]
-        )
-
-        # Print video information. Note that max frame is updated later if fewer frames detected
-        cap = cv2.VideoCapture(video_dict["fpath"])
-        cap_max = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        print("total frames: {frames}".format(frames=cap_max))
-        print("nominal fps: {fps}".format(fps=cap.get(cv2.CAP_PROP_FPS)))
-        print(
-            "dimensions (h x w): {h},{w}".format(
-                h=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-                w=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
-            )
-        )
-
-        if accept_p_frames is False:
-            check_p_frames(cap)
-
-        # Analyze frame by frame motion and freezing and save csv of results
-        Motion = Measure_Motion(video_dict, mt_cutoff, SIGMA=1)
-        Freezing = Measure_Freezing(Motion, FreezeThresh, MinDuration)
-        SaveData(video_dict, Motion, Freezing, mt_cutoff, FreezeThresh, MinDuration)
-        summary = Summarize(
-            video_dict,
-            Motion,
-            Freezing,
-            FreezeThresh,
-            MinDuration,
-            mt_cutoff,
-            bin_dict=bin_dict,
-        )
+    # The crop is passed as a CropSpec so that it can be sent to workers
+    batch_dict = dict(video_dict, crop=CropSpec.from_crop(video_dict.get("crop")))
+    args = (bin_dict, mt_cutoff, FreezeThresh, MinDuration, SIGMA, file_format)
+    summaries, failed = {}, {}
 
-        # Add summary info for individual file to larger summary of all files
+    # Check for p frames up front. Results are cached, so repeated runs are cheap.
+    files = []
+    for file in video_dict["FileNames"]:
         try:
-            summary_all = pd.concat([summary_all, summary])
-        except (
-            NameError
-        ):  # to be done for first file in list, before summary_all is created
-            summary_all = summary
+            fpath = os.path.join(os.path.normpath(video_dict["dpath"]), file)
+            if accept_p_frames is False:
+                check_p_frames(fpath)
+            files.append(file)
+        except Exception as error:
+            failed[file] = repr(error)
+
+    # Loop through files
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            jobs = {
+                executor.submit(_batch_file, batch_dict, file, *args): file
+                for file in files
+            }
+            for job in as_completed(jobs):
+                try:
+                    summaries[jobs[job]] = job.result()
+                    print("Finished File: {f}".format(f=jobs[job]))
+                except Exception as error:
+                    failed[jobs[job]] = repr(error)
+    else:
+        for file in files:
+            try:
+                summaries[file] = _batch_file(batch_dict, file, *args)
+            except Exception as error:
+                failed[file] = repr(error)
+
+    # Combine summary info for individual files into summary of all files
+    summaries = [summaries[f] for f in video_dict["FileNames"] if f in summaries]
+    summary_all = pd.concat(summaries) if summaries else pd.DataFrame()
+    summary_all.attrs["failed"] = failed
+    for file, error in failed.items():
+        print("Failed File: {f}. {e}".format(f=file, e=error))
 
     # Write summary data to csv file
     sum_pathout = os.path.join(
@@ -1204,16 +2311,73 @@ def Batch(
     return summary_all
 
 
+def _batch_file(
+    video_dict,
+    file,
+    bin_dict,
+    mt_cutoff,
+    FreezeThresh,
+    MinDuration,
+    SIGMA,
+    file_format="csv",
+):
+    """
+    Analyzes a single video of a batch, saves its frame by frame data and returns its
+    summary. Used by `Batch`, either directly or in a worker process.
+    """
+    # Set file
+    print("Processing File: {f}".format(f=file))
+    video_dict = dict(video_dict, file=file)
+    video_dict["fpath"] = os.path.join(os.path.normpath(video_dict["dpath"]), file)
+
+    # Print video information. Note that max frame is updated later if fewer frames detected
+    cap = cv2.VideoCapture(video_dict["fpath"])
+    cap_max = frame_count(video_dict["fpath"], cap)
+    print("total frames: {frames}".format(frames=cap_max))
+    print("nominal fps: {fps}".format(fps=cap.get(cv2.CAP_PROP_FPS)))
+    print(
+        "dimensions (h x w): {h},{w}".format(
+            h=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            w=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        )
+    )
+    cap.release()
+
+    # Analyze frame by frame motion and freezing and save csv of results
+    Motion = Measure_Motion(video_dict, mt_cutoff, SIGMA=SIGMA)
+    Freezing = Measure_Freezing(Motion, FreezeThresh, MinDuration)
+    SaveData(
+        video_dict,
+        Motion,
+        Freezing,
+        mt_cutoff,
+        FreezeThresh,
+        MinDuration,
+        file_format=file_format,
+    )
+    return Summarize(
+        video_dict,
+        Motion,
+        Freezing,
+        FreezeThresh,
+        MinDuration,
+        mt_cutoff,
+        bin_dict=bin_dict,
+    )
+
+
 ########################################################################################
 
 
-def Calibrate(video_dict, cal_pix, SIGMA, accept_p_frames=False):
+def Calibrate(video_dict, cal_pix=None, SIGMA=1, accept_p_frames=False):
     """
     -------------------------------------------------------------------------------------
 
     Using empty video (i.e. no animal), find distribution of frame by frame pixel changes.
     99.99 percentile is printed, and twice this number is recommended threshold for
-    `mt_cutoff`. Additionally, histogram of distribution is returned.
+    `mt_cutoff`. Additionally, histogram of distribution is returned. The distribution
+    is accumulated frame by frame in a `PixelChangeHistogram`, so memory use does not
+    depend on the number of frames or pixels.
 
     -------------------------------------------------------------------------------------
     Args:
@@ -1235,12 +2399,13 @@ def Calibrate(video_dict, cal_pix, SIGMA, accept_p_frames=False):
                 'FileNames' : (only if batch processing)
                               List of filenames of videos in folder to be batch
                               processed.  [list]
-                'cal_frms' : number of frames to calibrate based upon
+                'cal_frms' : number of frames to calibrate based upon. Set to
+                             None to calibrate on the whole video.
 
         cal_pix:: [int]
             Number of pixels in frame to base calibration upon. Random selection of
-            all pixels, sampled with replacement. Note that sampling strategy was
-            implemented to reduce memory load.
+            all pixels, sampled with replacement. Set to None (default) to use all
+            pixels.
 
         SIGMA:: [float]
             Sigma value for gaussian filter applied to each image. Passed to
@@ -1259,83 +2424,54 @@ def Calibrate(video_dict, cal_pix, SIGMA, accept_p_frames=False):
 
     -------------------------------------------------------------------------------------
     Notes:
+        - The 99.99 percentile is read from a histogram with bins of 1/64 grayscale
+          level and is within half a bin (1/128 grayscale level) of the exact
+          percentile of the pixel changes.
 
     """
 
-    # Upoad file
-    cap = cv2.VideoCapture(video_dict["fpath"])
-
     # check for p frames
     if accept_p_frames is False:
-        check_p_frames(cap)
-
-    # Initialize matrix for difference values
-    cal_dif = np.zeros((video_dict["cal_frms"], cal_pix))
+        check_p_frames(video_dict["fpath"])
 
-    # Initialize video
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-
-    # Initialize first frame
-    ret, frame = cap.read()
-    frame_new = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    if video_dict["dsmpl"] < 1:
-        frame_new = cv2.resize(
-            frame_new,
-            (
-                int(frame_new.shape[1] * video_dict["dsmpl"]),
-                int(frame_new.shape[0] * video_dict["dsmpl"]),
-            ),
-            cv2.INTER_NEAREST,
-        )
-    frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-
-    # Get random set of pixels to examine across frames
-    h, w = frame_new.shape
-    h_loc = np.random.rand(cal_pix, 1) * h
-    h_loc = h_loc.astype(int)
-    w_loc = np.random.rand(cal_pix, 1) * w
-    w_loc = w_loc.astype(int)
-
-    # Loop through frames to detect frame by frame differences
-    for x in range(1, video_dict["cal_frms"]):
-        # Reset old frame
-        frame_old = frame_new
-
-        # Load next frame
-        ret, frame = cap.read()
-
-        if ret:
-            # Process frame
-            frame_new = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            if video_dict["dsmpl"] < 1:
-                frame_new = cv2.resize(
-                    frame_new,
-                    (
-                        int(frame_new.shape[1] * video_dict["dsmpl"]),
-                        int(frame_new.shape[0] * video_dict["dsmpl"]),
-                    ),
-                    cv2.INTER_NEAREST,
-                )
-            frame_new = cv2.GaussianBlur(frame_new.astype("float"), (0, 0), SIGMA)
-
-            # Get differences for select pixels
-            frame_pix_dif = np.absolute(
-                frame_new[h_loc, w_loc] - frame_old[h_loc, w_loc]
-            )
-            frame_pix_dif = frame_pix_dif[:, 0]
-
-            # Populate difference array
-            cal_dif[x, :] = frame_pix_dif
-
-        else:  # if no frame returned
-            cal_dif = cal_dif[:x, :]
-            print("Only {a} frames detected".format(a=x))
-            break
-
-    percentile = np.percentile(cal_dif, 99.99)
+    # Upoad file
+    with FrameSource(
+        video_dict["fpath"], 0, video_dict["cal_frms"], video_dict["dsmpl"]
+    ) as frames:
+        # Initialize first frame and histogram of difference values
+        ret, frame_new = frames.read()
+        kernel = MotionKernel(0, SIGMA)
+        kernel.reset(frame_new)
+        cal_hist = PixelChangeHistogram()
+
+        # Get random set of pixels to examine across frames
+        if cal_pix is not None:
+            h, w = frame_new.shape
+            h_loc = np.random.rand(cal_pix, 1) * h
+            h_loc = h_loc.astype(int)
+            w_loc = np.random.rand(cal_pix, 1) * w
+            w_loc = w_loc.astype(int)
+
+        # Loop through frames to detect frame by frame differences
+        for x in range(1, frames.stop):
+            # Load next frame
+            ret, frame_new = frames.read()
+
+            if ret:
+                # Get differences and add them to histogram
+                frame_dif = kernel.difference(frame_new)
+                if cal_pix is not None:
+                    frame_dif = frame_dif[h_loc, w_loc]
+                cal_hist.add(frame_dif)
+
+            else:  # if no frame returned
+                print("Only {a} frames detected".format(a=x))
+                break
+
+    percentile = cal_hist.percentile(99.99)
 
     # Calculate grayscale change cutoff for detecting motion
-    cal_dif_avg = np.nanmean(cal_dif)
+    cal_dif_avg = cal_hist.mean()
 
     # Set Cutoff
     mt_cutoff = 2 * percentile
@@ -1345,7 +2481,8 @@ def Calibrate(video_dict, cal_pix, SIGMA, accept_p_frames=False):
     print("99.99 percentile of pixel change differences: " + str(percentile))
     print("Grayscale change cut-off for pixel change: " + str(mt_cutoff))
 
-    hist_freqs, hist_edges = np.histogram(cal_dif, bins=np.arange(30), density=True)
+    hist_freqs, hist_edges = cal_hist.histogram(np.arange(30), density=True)
+    hv = _holoviews()
     hist = hv.Histogram((hist_edges, hist_freqs))
     hist.opts(
         title="Motion Cutoff: " + str(np.around(mt_cutoff, 1)),
@@ -1357,7 +2494,71 @@ def Calibrate(video_dict, cal_pix, SIGMA, accept_p_frames=False):
     return hist * vline
 
 
-def check_p_frames(cap, p_prop_allowed=0.01, frames_checked=300):
+class PixelChangeHistogram:
+    """
+    -------------------------------------------------------------------------------------
+
+    Running histogram of frame by frame pixel changes with fixed bins of width
+    `1 / bins_per_level` over the grayscale range [0, 256). Memory use is constant
+    (one count per bin) however many frames and pixels are added. Used by `Calibrate`.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        bins_per_level:: [int]
+            Number of bins per grayscale level.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        Percentiles interpolate linearly between the two pixel changes around the
+        requested rank, as `np.percentile` does, each taken as the center of the bin
+        that holds it. Both are within half a bin width of the exact values, so the
+        percentile is too.
+
+    """
+
+    def __init__(self, bins_per_level=64):
+        self.bins_per_level = bins_per_level
+        self.bin_width = 1 / bins_per_level
+        self.counts = np.zeros(256 * bins_per_level, dtype=np.int64)
+        self.total = 0.0
+
+    def add(self, dif):
+        """Adds pixel changes (float32 array, e.g. `MotionKernel.difference`)."""
+        dif = np.ascontiguousarray(dif, dtype=np.float32).reshape(-1, 1)
+        counts = cv2.calcHist([dif], [0], None, [len(self.counts)], [0, 256])
+        self.counts += counts.reshape(-1).astype(np.int64)
+        self.total += float(dif.sum(dtype=np.float64))
+
+    @property
+    def n(self):
+        """Number of pixel changes added."""
+        return int(self.counts.sum())
+
+    def mean(self):
+        """Mean pixel change."""
+        return self.total / self.n if self.n else np.nan
+
+    def percentile(self, q):
+        """Percentile `q` (0-100) of the pixel changes, within half a bin width."""
+        rank = q / 100 * (self.n - 1)
+        below = int(np.floor(rank))
+        ranks = [below, min(below + 1, self.n - 1)]
+        bins = np.searchsorted(np.cumsum(self.counts), ranks, side="right")
+        centers = (bins + 0.5) * self.bin_width
+        return float(centers[0] + (rank - below) * (centers[1] - centers[0]))
+
+    def histogram(self, bins, density=False):
+        """Counts in coarser bins with edges `bins`, which must be multiples of the bin
+        width. Same return values as `np.histogram`."""
+        edges = np.round(np.asarray(bins) * self.bins_per_level).astype(int)
+        cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        hist = np.diff(cumulative[np.clip(edges, 0, len(self.counts))])
+        if density:
+            hist = hist / (hist.sum() * np.diff(bins))
+        return hist, np.asarray(bins)
+
+
+def check_p_frames(fpath, p_prop_allowed=0.01, frames_checked=300):
     """
     -------------------------------------------------------------------------------------
 
@@ -1365,8 +2566,9 @@ def check_p_frames(cap, p_prop_allowed=0.01, frames_checked=300):
 
     -------------------------------------------------------------------------------------
     Args:
-        cap:: [cv2.videocapture]
-            OpenCV video capture object.
+        fpath:: [str]
+            Path to video file. An OpenCV video capture object is also accepted, in
+            which case `frames_checked` frames are read from it.
         p_prop_allowed:: [numeric]
             Proportion of putative p-frames permitted.  Alternatively, proportion of
             frames permitted to return False when grabbed.
@@ -1379,16 +2581,20 @@ def check_p_frames(cap, p_prop_allowed=0.01, frames_checked=300):
 
     -------------------------------------------------------------------------------------
     Notes:
+        See `p_frame_proportion` for how frames are inspected. A video of which no
+        frame can be inspected fails the check.
 
     """
 
-    frames_checked = min(frames_checked, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    if isinstance(fpath, cv2.VideoCapture):
+        frames_checked = min(frames_checked, int(fpath.get(cv2.CAP_PROP_FRAME_COUNT)))
+        p_frms = sum(not fpath.read()[0] for i in range(frames_checked))
+    else:
+        p_frms, frames_checked = p_frame_proportion(fpath, frames_checked)
+    if frames_checked <= 0:
+        raise RuntimeError("Video could not be read. Check the file path and format.")
     p_allowed = int(frames_checked * p_prop_allowed)
 
-    p_frms = 0
-    for i in range(frames_checked):
-        ret, frame = cap.read()
-        p_frms = p_frms + 1 if not ret else p_frms
     if p_frms > p_allowed:
         raise RuntimeError(
             "Video compression method not supported. "
@@ -1397,3 +2603,104 @@ def check_p_frames(cap, p_prop_allowed=0.01, frames_checked=300):
             )
             + "Consider video conversion."
         )
+
+
+_P_FRAME_CACHE = {}
+
+
+def p_frame_proportion(fpath, frames_checked=300):
+    """
+    -------------------------------------------------------------------------------------
+
+    Counts p/blank frames among the first `frames_checked` frames of a video without
+    touching any capture of the caller. A frame counts if it cannot be read. With the
+    optional `av` (PyAV) package, packets are demuxed but not decoded, and packets
+    that are empty or flagged as corrupt are counted. The packet sizes in the frame
+    index of the video (see `video_index.index_video`) are used instead if present.
+    Otherwise, if the container cannot be read by PyAV or if the index lacks packet
+    sizes, frames are grabbed from a separate OpenCV capture and failed grabs are
+    counted. Results are cached in memory and in the check results sidecar of the
+    video (see `video_index.save_check`), per file size and modification time.
+
+    -------------------------------------------------------------------------------------
+    Args:
+        fpath:: [str]
+            Path to video file.
+        frames_checked:: [numeric]
+            Number of frames to scan for p/blank frames.
+
+    -------------------------------------------------------------------------------------
+    Returns:
+        p_frms:: [int]
+            Number of p/blank frames found.
+        frames_checked:: [int]
+            Number of frames inspected. Smaller than requested for short videos.
+
+    -------------------------------------------------------------------------------------
+    Notes:
+        - Counting packets is a heuristic, as nothing is decoded: a packet that is
+          neither empty nor flagged as corrupt may still fail to decode, and an empty
+          packet (a dropped or repeated frame) is counted even if a reader would
+          return the previous frame for it.
+
+    """
+
+    stat = os.stat(fpath)
+    key = (os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns, frames_checked)
+    check = "p_frames_{n}".format(n=frames_checked)
+    if key not in _P_FRAME_CACHE:
+        counts = load_check(fpath, check)
+        if counts is None:
+            counts = _count_p_frames(fpath, frames_checked)
+            save_check(fpath, check, list(counts))
+        _P_FRAME_CACHE[key] = tuple(counts)
+    return _P_FRAME_CACHE[key]
+
+
+def _count_p_frames(fpath, frames_checked):
+    """Counts p/blank frames from the frame index, the packets or failed grabs, see
+    `p_frame_proportion`."""
+    try:
+        import av
+    except ImportError:
+        av = None
+    counts = None
+    index = frame_index(fpath)
+    if index is not None and index.keyframe is not None:
+        checked = min(frames_checked, index.frame_count)
+        sizes = index.size[:checked]
+        if not (sizes < 0).any():
+            counts = int((sizes == 0).sum()), checked
+    elif av is not None:
+        try:
+            counts = _packet_p_frames(av, fpath, frames_checked)
+        except av.FFmpegError:
+            counts = None
+    if counts is None or counts[1] == 0:
+        counts = _grab_p_frames(fpath, frames_checked)
+    return counts
+
+
+def _packet_p_frames(av, fpath, frames_checked):
+    """Counts empty and corrupt packets of the first video stream."""
+    p_frms = checked = 0
+    with av.open(fpath) as container:
+        stream = container.streams.video[0]
+        for packet in container.demux(stream):
+            if packet.dts is None and packet.size == 0:
+                continue  # flush packet at end of stream
+            if checked == frames_checked:
+                break
+            checked += 1
+            if packet.size == 0 or packet.is_corrupt:
+                p_frms += 1
+    return p_frms, checked
+
+
+def _grab_p_frames(fpath, frames_checked):
+    """Counts failed grabs of the first frames, using a capture of its own."""
+    cap = cv2.VideoCapture(fpath)
+    frames_checked = min(frames_checked, max(0, frame_count(fpath, cap)))
+    p_frms = sum(not cap.grab() for i in range(frames_checked))
+    cap.release()
+    return p_frms, frames_checked
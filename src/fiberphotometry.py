@@ -2,14 +2,24 @@
 This class is based on [FiberFlow](https://github.com/MicTott/FiberFlow)
 maintainer: @gergelyturi"""
 
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
 from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Dict, Tuple
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
+import pandas as pd
 from scipy.signal import butter, filtfilt, medfilt
 from scipy.stats import linregress
-from tdt import read_block
+from tdt import ALLOWED_FORMATS, StructType, fix_var_name, read_block, read_sev
 
 
 class Channels(Enum):
@@ -29,7 +39,29 @@ class ImportTDTData:
     or with kwargs:
     >>> tdt_tank = fp.ImportTDTData(tank_path="path/to/tank", kwargs={"evtype": ["epocs]})
 
+    or with data that is already in memory (the tank is not read):
+    >>> tdt_tank = fp.ImportTDTData(tank_path="path/to/tank", data=block)
+
+    or through an on-disk cache of decoded tanks, so that the tank is only decoded on
+    the first read and later reads (also with other t1/t2) slice memory-mapped files:
+    >>> cache = fp.TankCache("path/to/cache", max_bytes=20 * 2**30)
+    >>> tdt_tank = fp.ImportTDTData(tank_path="path/to/tank", cache=cache)
+
+    or with the photometry streams in shared memory ("memory") or in memory-mapped
+    files ("file"), so that other processes can attach to them without a copy:
+    >>> tdt_tank = fp.ImportTDTData(tank_path="path/to/tank", share="memory")
+    >>> shared = tdt_tank.shared_streams  # picklable, send it to the workers
+    >>> worker_tank = fp.ImportTDTData.attach("path/to/tank", shared)  # in a worker
+    >>> shared.unlink()  # in the owner, when all workers are done
+
     for available kwargs see: https://www.tdt.com/docs/sdk/offline-data-analysis/offline-data-python/
+
+    Only the tank headers are read up front. Every store is decoded on its first
+    access, e.g. `tdt_tank.raw_data` decodes the two photometry streams and nothing
+    else. Set `lazy=False` to read everything at once with `tdt.read_block`.
+
+    Recordings that are too long to hold in memory can be processed in chunks, see
+    `chunks`.
     """
 
     tank_path: str  # path to TDT tank
@@ -37,12 +69,52 @@ class ImportTDTData:
     ISOS_CHANNEL: str = Channels.ISOS
 
     kwargs: Dict[str, Any] = field(default_factory=dict)
+    data: Optional[StructType] = field(default=None, repr=False)
+    share: Optional[str] = None  # None, "memory" or "file", see `share_streams`
+    cache: Optional["TankCache"] = field(default=None, repr=False)
+    lazy: bool = True  # decode stores on first access
+    shared_streams: Optional["SharedStreams"] = field(
+        default=None, init=False, repr=False
+    )
 
     def __post_init__(self):
-        try:
-            self.data = read_block(self.tank_path, **self.kwargs)
-        except Exception as e:
-            raise RuntimeError(f"Error reading TDT tank: {e}")
+        if self.data is None:
+            if self.cache is not None:
+                reader = self.cache.read_block
+            elif self.lazy and not set(self.kwargs) & _EAGER_KWARGS:
+                reader = _read_block_lazy
+            else:
+                reader = read_block
+            try:
+                self.data = reader(self.tank_path, **self.kwargs)
+            except Exception as e:
+                raise RuntimeError(f"Error reading TDT tank: {e}")
+        if self.share is not None:
+            self.share_streams(self.share)
+
+    @classmethod
+    def attach(cls, tank_path: str, shared: "SharedStreams") -> "ImportTDTData":
+        """Returns the recording of streams shared by another process (see
+        `share_streams`) without copying them. The tank is not read."""
+        recording = cls(tank_path, data=shared.attach())
+        recording.shared_streams = shared
+        return recording
+
+    def share_streams(
+        self, mode: str = "memory", directory: Optional[str] = None
+    ) -> "SharedStreams":
+        """Moves the photometry streams into shared memory (`mode="memory"`) or into
+        memory-mapped .npy files in `directory` (`mode="file"`, a temporary directory
+        by default). The streams of this recording are replaced by views of the shared
+        buffers, so the data is held once however many processes attach to it with
+        `ImportTDTData.attach`. Returns the `SharedStreams`, also kept as
+        `shared_streams`."""
+        stores = [self.DYNAMIC_CHANNEL.value, self.ISOS_CHANNEL.value]
+        self.shared_streams = SharedStreams.create(self.data, stores, mode, directory)
+        shared = self.shared_streams.attach()
+        for store in stores:
+            self.data.streams[store] = shared.streams[store]
+        return self.shared_streams
 
     @property
     def sampling_frequency(self) -> float:
@@ -61,9 +133,638 @@ class ImportTDTData:
         """Loads raw data for the specified channel."""
         try:
             return self.data.streams[channel.value].data
-        except KeyError:
+        except (KeyError, AttributeError):
             raise ValueError(f"Channel {channel.value} not found in data.")
 
+    def segment(self, t1: float, t2: float) -> "ImportTDTData":
+        """Returns the streams between t1 and t2 (in seconds) without re-reading the tank.
+
+        The streams are sliced from the data already in memory, so the tank only has to
+        be read once for any number of windows. Sample boundaries follow the `t1`/`t2`
+        rounding of `tdt.read_block`, i.e. the slices are identical to the arrays of a
+        windowed read.
+
+        Example:
+        >>> recording = fp.ImportTDTData(tank_path="path/to/tank")
+        >>> segment = recording.segment(10.0, 70.0)
+        >>> dff = fp.FiberPhotometryAnalysis("path/to/tank", photometry=segment).calculate_deltaf_f()
+        """
+        segment = copy.copy(self)
+        segment.kwargs = {**self.kwargs, "t1": t1, "t2": t2}
+        if isinstance(self.data, _LazyStores):
+            segment.data = self.data.map(lambda value: value)
+        else:
+            segment.data = StructType(self.data.items())
+        segment.data.streams = _slice_streams(self.data.streams, t1, t2)
+        return segment
+
+    def chunks(
+        self,
+        duration: float,
+        overlap: float = 0.0,
+        t1: float = 0.0,
+        t2: Optional[float] = None,
+        method: str = "tev",
+    ) -> Iterator["ImportTDTData"]:
+        """Yields both photometry channels in chunks of `duration` seconds between t1
+        and t2 (the end of the recording by default). Consecutive chunks share
+        `overlap` seconds, e.g. to discard filter edge effects, and the last chunk is
+        cut at t2. Every chunk is an `ImportTDTData` holding the two streams only, with
+        `t1`/`t2` of the chunk in its kwargs.
+
+        Only one chunk is read at a time, so memory does not grow with the length of
+        the recording as long as earlier chunks are not kept. With `method="tev"` the
+        tank headers are read once and every chunk reads its blocks at their TEV
+        offsets; `method="window"` reads every chunk with a windowed `tdt.read_block`,
+        which also handles streams stored in SEV files; `method="memory"` slices the
+        chunks from the streams of this recording (see `segment`).
+
+        Example:
+        >>> recording = fp.ImportTDTData(tank_path="path/to/tank")
+        >>> for chunk in recording.chunks(3600, overlap=60):
+        ...     dff = fp.FiberPhotometryAnalysis("path/to/tank", photometry=chunk).calculate_deltaf_f()
+        """
+        if duration <= 0 or not 0 <= overlap < duration:
+            raise ValueError("Chunks need duration > 0 and 0 <= overlap < duration.")
+        if method == "memory":
+            stream = self.data.streams[self.DYNAMIC_CHANNEL.value]
+            end = stream.start_time + stream.data.shape[-1] / stream.fs
+            read = self.segment
+        elif method in ("tev", "window"):
+            headers = read_block(self.tank_path, headers=1)
+            stores = [self.DYNAMIC_CHANNEL.value, self.ISOS_CHANNEL.value]
+            if not all(store in headers.stores.keys() for store in stores):
+                method = "window"  # SEV streams are not in the TSQ headers
+                end = float(headers.stop_time[0] - headers.start_time[0])
+            else:
+                end = max(_stream_end(headers.stores[store]) for store in stores)
+            reader = _ChunkReader(self.tank_path, stores, self.kwargs, headers, method)
+
+            def read(t1, t2):
+                return self._chunk(t1, t2, reader(t1, t2))
+
+        else:
+            raise ValueError(f"Unknown chunk method: {method}")
+        end = end if t2 is None or t2 <= 0 else min(t2, end)
+        if not np.isfinite(end):
+            raise ValueError("The end of the recording is unknown, set t2.")
+        return (read(*window) for window in _chunk_windows(t1, end, duration, overlap))
+
+    def _chunk(self, t1: float, t2: float, data: StructType) -> "ImportTDTData":
+        chunk = copy.copy(self)
+        chunk.kwargs = {**self.kwargs, "t1": t1, "t2": t2}
+        chunk.data = data
+        chunk.shared_streams = None
+        return chunk
+
+
+@dataclass
+class SharedStreams:
+    """Streams of a recording placed in shared memory or in memory-mapped files.
+
+    Only the description of the streams is pickled, so a SharedStreams can be sent to
+    other processes, which attach to the same buffers with `attach` (or
+    `ImportTDTData.attach`). The process that created the buffers releases them with
+    `unlink` once no process needs them anymore.
+    """
+
+    mode: str  # "memory" or "file"
+    streams: Dict[str, Dict[str, Any]]
+    directory: Optional[str] = None
+    temporary: bool = False  # whether `directory` was created for the streams
+    _blocks: List[shared_memory.SharedMemory] = field(
+        default_factory=list, repr=False
+    )
+
+    @classmethod
+    def create(
+        cls,
+        data: StructType,
+        stores: List[str],
+        mode: str = "memory",
+        directory: Optional[str] = None,
+    ) -> "SharedStreams":
+        """Copies the streams `stores` of `data` into shared buffers."""
+        if mode not in ("memory", "file"):
+            raise ValueError(f"Unknown share mode: {mode}. Use 'memory' or 'file'.")
+        temporary = mode == "file" and directory is None
+        if temporary:
+            directory = tempfile.mkdtemp(prefix="tdt_streams_")
+        elif mode == "file":
+            os.makedirs(directory, exist_ok=True)
+        shared = cls(mode, {}, directory, temporary)
+        for store in stores:
+            stream = data.streams[store]
+            description = {
+                "shape": stream.data.shape,
+                "dtype": stream.data.dtype.str,
+                "fs": stream.fs,
+                "start_time": stream.start_time,
+            }
+            if mode == "memory":
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(stream.data.nbytes, 1)
+                )
+                buffer = np.ndarray(
+                    stream.data.shape, dtype=stream.data.dtype, buffer=block.buf
+                )
+                shared._blocks.append(block)
+                description["shm_name"] = block.name
+            else:
+                description["path"] = os.path.join(directory, f"{store}.npy")
+                buffer = np.lib.format.open_memmap(
+                    description["path"],
+                    mode="w+",
+                    dtype=stream.data.dtype,
+                    shape=stream.data.shape,
+                )
+            buffer[...] = stream.data
+            if mode == "file":
+                buffer.flush()
+            shared.streams[store] = description
+        return shared
+
+    def attach(self) -> StructType:
+        """Returns the shared streams as `tdt.read_block` data, without copies."""
+        data = StructType(streams=StructType())
+        for name, stream in self.streams.items():
+            if self.mode == "memory":
+                block = self._block(stream["shm_name"])
+                array = np.ndarray(
+                    stream["shape"], dtype=stream["dtype"], buffer=block.buf
+                )
+            else:
+                array = np.load(stream["path"], mmap_mode="r")
+            data.streams[name] = StructType(
+                name=name,
+                fs=stream["fs"],
+                start_time=stream["start_time"],
+                data=array,
+            )
+        return data
+
+    def unlink(self) -> None:
+        """Releases the shared buffers. Processes that are attached keep their views
+        until they exit, but no process can attach anymore."""
+        if self.mode == "memory":
+            for stream in self.streams.values():
+                try:
+                    self._block(stream["shm_name"]).unlink()
+                except FileNotFoundError:
+                    pass
+        else:
+            for stream in self.streams.values():
+                if os.path.exists(stream["path"]):
+                    os.remove(stream["path"])
+            if self.temporary and os.path.isdir(self.directory):
+                os.rmdir(self.directory)
+
+    def _block(self, name: str) -> shared_memory.SharedMemory:
+        # blocks are kept referenced for as long as this object lives
+        for block in self._blocks:
+            if block.name == name:
+                return block
+        block = shared_memory.SharedMemory(name=name)
+        self._blocks.append(block)
+        return block
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_blocks"] = []
+        return state
+
+
+def _slice_streams(streams: StructType, t1: float, t2: float) -> StructType:
+    """Returns views of `streams` between t1 and t2 (in seconds), with the sample
+    boundaries of a windowed `tdt.read_block`. Streams that are not loaded yet are
+    sliced when they are loaded."""
+    if isinstance(streams, _LazyStores):
+        return streams.map(lambda stream: _slice_stream(stream, t1, t2))
+    return StructType(
+        {name: _slice_stream(stream, t1, t2) for name, stream in streams.items()}
+    )
+
+
+def _slice_stream(stream: StructType, t1: float, t2: float) -> StructType:
+    fs = stream.fs
+    first_sample = _time_to_sample(stream.start_time, fs)
+    window_start = _time_to_sample(t1, fs)
+    start = max(window_start - first_sample, 0)
+    if t2 > 0 and np.isfinite(t2):
+        stop = max(_time_to_sample(t2, fs) - first_sample, 0)
+    else:
+        stop = None
+    sliced = StructType(stream.items())
+    sliced.data = stream.data[..., start:stop]
+    sliced.start_time = window_start / fs
+    return sliced
+
+
+def _chunk_windows(
+    t1: float, t2: float, duration: float, overlap: float
+) -> List[Tuple[float, float]]:
+    """(start, stop) in seconds of chunks of `duration` from t1 to t2 that overlap by
+    `overlap` seconds."""
+    windows = []
+    start = t1
+    while start < t2:
+        stop = min(start + duration, t2)
+        windows.append((start, stop))
+        if stop >= t2:
+            break
+        start += duration - overlap
+    return windows
+
+
+def _stream_end(header: StructType) -> float:
+    """End in seconds of a stream store, from its TSQ headers."""
+    itemsize = np.dtype(ALLOWED_FORMATS[header.dform]).itemsize
+    samples_per_block = (int(header.size) - 10) * 4 // itemsize
+    return float(header.ts[-1]) + samples_per_block / header.fs
+
+
+@dataclass
+class _ChunkReader:
+    """Reads the streams `stores` between t1 and t2 from a tank, either with the TSQ
+    headers read once ("tev") or with a windowed `tdt.read_block` ("window")."""
+
+    tank_path: str
+    stores: List[str]
+    kwargs: Dict[str, Any]
+    headers: StructType = field(repr=False)
+    method: str = "tev"
+
+    def __post_init__(self):
+        ignored = {"t1", "t2", "ranges", "store", "evtype", "headers"}
+        self.kwargs = {k: v for k, v in self.kwargs.items() if k not in ignored}
+        if self.method == "tev":
+            # read_block decodes every store of outside headers, keep only ours
+            self.headers = _store_headers(self.headers, self.stores)
+
+    def __call__(self, t1: float, t2: float) -> StructType:
+        if self.method == "tev":
+            source = {"headers": self.headers}
+        else:
+            source = {"store": [_raw_store_name(self.headers, s) for s in self.stores]}
+        window = {"t1": t1, "t2": t2, "evtype": ["streams"]}
+        try:
+            return read_block(self.tank_path, **self.kwargs, **source, **window)
+        except Exception as e:
+            raise RuntimeError(f"Error reading TDT tank: {e}")
+
+
+def _store_headers(headers: StructType, stores: List[str]) -> StructType:
+    """Copy of TSQ headers (see `tdt.read_block(headers=1)`) with only `stores`."""
+    narrowed = StructType(headers.items())
+    narrowed.stores = StructType({store: headers.stores[store] for store in stores})
+    return narrowed
+
+
+def _raw_store_name(headers: StructType, store: str) -> str:
+    """Name of a store in the tank, e.g. "465A" for "_465A". Stores missing from the
+    TSQ headers (SEV streams) only have the leading "_" of `tdt.fix_var_name` undone."""
+    if store in headers.stores.keys():
+        return headers.stores[store].name
+    return store[1:] if store[:1] == "_" and store[1:2].isdigit() else store
+
+
+def _time_to_sample(t: float, fs: float) -> int:
+    """Converts a time to a sample index the same way `tdt.read_block` does for `t1`."""
+    return int(np.ceil(np.round(t * fs * 1e9) / 1e9))
+
+
+# Lazy tank reading
+# `tdt.read_block(headers=1)` parses the TSQ file once and lists the stores of a tank
+# without decoding them. Every store is then decoded on its first access by passing
+# the parsed headers back to `read_block`, narrowed to that store, as `read_block`
+# decodes every store of outside headers and ignores `store`. Streams that are only
+# stored in SEV files are not in the TSQ headers; they are listed with
+# `tdt.read_sev(just_names=True)` and read with `read_block(store=...)`.
+
+_EVTYPES = ("epocs", "snips", "streams", "scalars")
+_EAGER_KWARGS = {"headers", "export", "bitwise", "combine"}
+
+
+class _LazyStores(StructType):
+    """StructType whose entries are loaded on first access with `load(name)`.
+
+    Entries that are not loaded yet are listed by `keys` and loaded by attribute or
+    item access; `items` and `values` load all entries."""
+
+    __slots__ = ("_pending", "_load")
+
+    def __init__(self, names, load, loaded=None):
+        super().__init__(loaded or {})
+        self._pending = [name for name in names if name not in self.__dict__]
+        self._load = load
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in _LazyStores.__slots__:
+            raise AttributeError(name)
+        if name not in self._pending:
+            raise AttributeError(name)
+        value = self._load(name)
+        self._pending.remove(name)
+        self.__dict__[name] = value
+        return value
+
+    def __bool__(self):
+        return bool(self.__dict__) or bool(self._pending)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def keys(self):
+        return list(self.__dict__) + list(self._pending)
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def values(self):
+        return [self[name] for name in self.keys()]
+
+    @property
+    def loaded(self) -> List[str]:
+        """Names of the entries that are loaded."""
+        return list(self.__dict__)
+
+    def map(self, func) -> "_LazyStores":
+        """Returns lazy stores holding `func(store)` of every store."""
+        loaded = {name: func(value) for name, value in self.__dict__.items()}
+        return _LazyStores(self.keys(), lambda name: func(self[name]), loaded)
+
+    def __reduce__(self):
+        return StructType, (dict(self.items()),)
+
+
+def _read_block_lazy(tank_path: str, **kwargs) -> StructType:
+    """Like `tdt.read_block(tank_path, **kwargs)`, but reads only the headers and
+    decodes every store on its first access."""
+    headers = read_block(tank_path, headers=1)
+    evtypes = kwargs.pop("evtype", None)
+    evtypes = ["all"] if evtypes is None else list(np.atleast_1d(evtypes))
+    evtypes = list(_EVTYPES) if "all" in evtypes else evtypes
+    store = kwargs.pop("store", "")
+    stores = None if not store else set(np.atleast_1d(store))
+    stores = None if stores is None else stores | {fix_var_name(s) for s in stores}
+
+    def loader(evtype):
+        def load(name):
+            if name in headers.stores.keys():
+                read = {"headers": _store_headers(headers, [name])}
+            else:
+                read = {"store": name}  # SEV only
+            block = read_block(tank_path, **kwargs, **read, evtype=[evtype])
+            return block[evtype][name]
+
+        return load
+
+    data = _LazyStores(
+        ["info"],
+        lambda name: read_block(
+            tank_path, **kwargs, headers=_store_headers(headers, []), evtype=["epocs"]
+        ).info,
+    )
+    for evtype in _EVTYPES:
+        names = [
+            key
+            for key, header in headers.stores.items()
+            if header.type_str == evtype
+        ]
+        if evtype == "streams":
+            raw_names = {headers.stores[key].name for key in names}
+            sev_names = read_sev(tank_path, just_names=True) or []
+            names += [name for name in sev_names if name not in raw_names]
+        if evtype not in evtypes:
+            names = []
+        elif stores is not None:
+            names = [
+                key
+                for key in names
+                if key in stores
+                or key in headers.stores.keys()
+                and headers.stores[key].name in stores
+            ]
+        data[evtype] = _LazyStores(names, loader(evtype))
+    t1, t2 = kwargs.get("t1", 0), kwargs.get("t2", 0)
+    data.time_ranges = kwargs.get("ranges")
+    if data.time_ranges is None:
+        data.time_ranges = np.array([[t1], [t2 if t2 > 0 else np.inf]])
+    return data
+
+
+# Tank cache
+# Decoded streams are stored as float32 .npy files and the epocs of all stores in a
+# single epoc table, in one directory per tank version. A tank version is identified
+# by the path, sizes and modification times of the tank files, so a tank that is still
+# recording gets a new entry (and the old one is dropped) when its files change.
+
+TANK_EXTENSIONS = (".tsq", ".tev", ".sev", ".tbk", ".tdx", ".tin", ".tnt")
+_CACHE_VERSION = 1
+_CACHED_EVTYPES = ("streams", "epocs")
+
+
+@dataclass
+class TankCache:
+    """On-disk cache of decoded TDT tanks, used as a drop-in for `tdt.read_block`.
+
+    The first read of a tank decodes the whole tank once and saves its streams and
+    epocs. Later reads, also with other `t1`/`t2`, `evtype` or `store`, memory-map the
+    saved streams and slice them, with the same sample boundaries as `read_block`.
+    Reads with other `read_block` arguments, and reads of snippets or scalars, go to
+    `read_block`. Store names in `store` are matched as the keys `read_block` gives
+    them (`tdt.fix_var_name`), e.g. "465A" selects `data.streams._465A`. When the cache
+    grows beyond `max_bytes`, the least recently used tanks are evicted.
+    """
+
+    directory: str
+    max_bytes: int = 10 * 2**30
+
+    def read_block(self, tank_path: str, **kwargs) -> StructType:
+        """Returns the data of a tank like `tdt.read_block(tank_path, **kwargs)`."""
+        t1, t2 = kwargs.pop("t1", 0), kwargs.pop("t2", 0)
+        evtype, store = kwargs.pop("evtype", None), kwargs.pop("store", "")
+        evtypes = ["all"] if evtype is None else list(np.atleast_1d(evtype))
+        evtypes = list(_CACHED_EVTYPES) if "all" in evtypes else evtypes
+        if kwargs or not set(evtypes) <= set(_CACHED_EVTYPES):
+            kwargs.update(t1=t1, t2=t2, evtype=evtype, store=store)
+            return read_block(tank_path, **kwargs)
+
+        entry = self._entry(tank_path)
+        with open(os.path.join(entry, "meta.json")) as f:
+            meta = json.load(f, object_hook=_from_json)
+        if evtype is None and meta["complete"] is False:
+            # the tank has snippets or scalars, which are not cached
+            return read_block(tank_path, t1=t1, t2=t2, store=store)
+        os.utime(os.path.join(entry, "meta.json"))  # last use, for eviction
+        stores = None if not store else {fix_var_name(s) for s in np.atleast_1d(store)}
+
+        data = StructType(
+            epocs=StructType(),
+            snips=StructType(),
+            streams=StructType(),
+            scalars=StructType(),
+            info=StructType(meta["info"]),
+        )
+        data.time_ranges = np.array([[t1], [t2 if t2 > 0 else np.inf]])
+        if "streams" in evtypes:
+            for name, attributes in meta["streams"].items():
+                if stores is None or name in stores:
+                    path = os.path.join(entry, f"{name}.npy")
+                    stream = StructType(attributes)
+                    stream.data = np.load(path, mmap_mode="r")
+                    data.streams[name] = stream
+            data.streams = _slice_streams(data.streams, t1, t2)
+        if "epocs" in evtypes and meta["epocs"]:
+            with np.load(os.path.join(entry, "epocs.npz")) as table:
+                table = {column: table[column] for column in table.files}
+            stop = t2 if t2 > 0 else np.inf
+            in_window = (table["onset"] >= t1) & (table["onset"] < stop)
+            for name, attributes in meta["epocs"].items():
+                if stores is None or name in stores:
+                    rows = in_window & (table["store"] == name)
+                    epoc = StructType(attributes)
+                    for column in ("onset", "offset", "data"):
+                        epoc[column] = table[column][rows]
+                    data.epocs[name] = _window_epoc(epoc, t1, stop)
+        return data
+
+    def clear(self) -> None:
+        """Removes all cached tanks."""
+        for entry in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _entry(self, tank_path: str) -> str:
+        """Directory of the cached tank, decoding and saving the tank if needed."""
+        tank_path = os.path.abspath(tank_path)
+        files = sorted(
+            (name, stat.st_size, stat.st_mtime_ns)
+            for name in os.listdir(tank_path)
+            if name.lower().endswith(TANK_EXTENSIONS)
+            for stat in [os.stat(os.path.join(tank_path, name))]
+        )
+        key = json.dumps([_CACHE_VERSION, tank_path, files])
+        entry = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+        if os.path.isfile(os.path.join(entry, "meta.json")):
+            return entry
+
+        # save into a temporary directory, then move it in place in one step
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=self.directory, prefix=".tmp_")
+        try:
+            _save_tank(read_block(tank_path), tank_path, tmp_entry)
+            os.rename(tmp_entry, entry)
+        except OSError:
+            if not os.path.isfile(os.path.join(entry, "meta.json")):
+                raise
+            shutil.rmtree(tmp_entry, ignore_errors=True)  # saved by another process
+        self._evict(keep=entry, tank_path=tank_path)
+        return entry
+
+    def _entries(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if os.path.isfile(os.path.join(self.directory, name, "meta.json"))
+        ]
+
+    def _evict(self, keep: str, tank_path: str) -> None:
+        """Drops older versions of `tank_path`, then the least recently used tanks
+        until the cache fits in `max_bytes`. `keep` is never evicted."""
+        entries = []
+        for entry in self._entries():
+            meta_path = os.path.join(entry, "meta.json")
+            with open(meta_path) as f:
+                cached_tank = json.load(f)["tank_path"]
+            if entry != keep and cached_tank == tank_path:
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry)
+            )
+            entries.append((os.path.getmtime(meta_path), size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry != keep:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+def _window_epoc(epoc: StructType, t1: float, t2: float) -> StructType:
+    """Fixes the time range of the events of `epoc` with onsets in [t1, t2) as
+    `tdt.read_block` does: the last offset is cut at t2, and t1 is added as first
+    onset if the first event is an offset."""
+    if len(epoc.onset) == 0:
+        return epoc
+    if epoc.offset[0] < epoc.onset[0] and epoc.onset[0] > t1:
+        epoc.onset = np.concatenate([[t1], epoc.onset])
+    if epoc.offset[-1] > t2:
+        epoc.offset[-1] = t2
+    return epoc
+
+
+def _save_tank(data: StructType, tank_path: str, entry: str) -> None:
+    """Saves the streams and epocs of a decoded tank into the directory `entry`."""
+    meta = {
+        "tank_path": tank_path,
+        "complete": not (data.snips.keys() or data.scalars.keys()),
+        "info": dict(data.info.items()),
+        "streams": {},
+        "epocs": {},
+    }
+    for name, stream in data.streams.items():
+        np.save(os.path.join(entry, f"{name}.npy"), stream.data.astype(np.float32))
+        meta["streams"][name] = {k: v for k, v in stream.items() if k != "data"}
+    table = {"store": [], "onset": [], "offset": [], "data": []}
+    for name, epoc in data.epocs.items():
+        onset = np.asarray(epoc.onset, dtype=np.float64)
+        table["store"].append(np.full(len(onset), name))
+        table["onset"].append(onset)
+        for column in ("offset", "data"):
+            values = epoc[column] if column in epoc.keys() else []
+            values = np.asarray(values, dtype=np.float64)
+            if len(values) != len(onset):
+                values = np.full(len(onset), np.nan)
+            table[column].append(values)
+        meta["epocs"][name] = {
+            k: v for k, v in epoc.items() if k not in ("onset", "offset", "data")
+        }
+    if meta["epocs"]:
+        np.savez(
+            os.path.join(entry, "epocs.npz"),
+            **{column: np.concatenate(values) for column, values in table.items()},
+        )
+    with open(os.path.join(entry, "meta.json"), "w") as f:
+        json.dump(meta, f, default=_to_json)
+
+
+def _to_json(value):
+    """JSON encoding of the tank attributes that are not plain JSON types."""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"__timedelta__": value.total_seconds()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot cache tank attribute of type {type(value).__name__}")
+
+
+def _from_json(value):
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    if "__timedelta__" in value:
+        return timedelta(seconds=value["__timedelta__"])
+    return value
+
 
 class SignalPreprocessor:
     """Class for preprocessing signals from fiber photometry data."""
@@ -126,13 +827,20 @@ class DeltaFoFCalculator:
 
 @dataclass
 class FiberPhotometryAnalysis:
-    """Class for running the complete fiber photometry analysis."""
+    """Class for running the complete fiber photometry analysis.
+
+    An already loaded `ImportTDTData` (e.g. a segment of a recording) can be passed as
+    `photometry`, in which case the tank is not read again."""
 
     tank_path: str
     kwargs: Dict[str, Any] = field(default_factory=dict)
+    photometry: Optional[ImportTDTData] = field(default=None, repr=False)
 
     def __post_init__(self):
-        self.photometry = ImportTDTData(tank_path=self.tank_path, kwargs=self.kwargs)
+        if self.photometry is None:
+            self.photometry = ImportTDTData(
+                tank_path=self.tank_path, kwargs=self.kwargs
+            )
 
     def calculate_deltaf_f(self, strategy: str = "default") -> np.array:
         """Calculates the dF/F signal from the raw data using the specified strategy."""
@@ -195,3 +903,223 @@ class DeltaFoFStrategies:
 
         dF_F = 100 * (Y_dF_all / Y_fit_all)
         return dF_F
+
+
+# Segment files
+# Segments extracted from long recordings can be saved as csv (text, float64) or in a
+# binary, columnar format (parquet, hdf5 or npz) with float32 columns. The binary
+# formats keep the sampling frequency, the segment start datetime and any other
+# metadata with the data. Parquet and hdf5 need the optional `pyarrow` and `h5py`
+# packages.
+
+SEGMENT_COMPRESSION = {"parquet": "zstd", "hdf5": "gzip", "npz": "deflate"}
+_SEGMENT_METADATA_KEY = "fiberphotometry"
+
+
+def save_segment(
+    data: Dict[str, np.array],
+    path: str,
+    sampling_frequency: Optional[float] = None,
+    start_datetime: Optional[datetime] = None,
+    compression: Optional[str] = "default",
+    **metadata,
+) -> str:
+    """Saves the columns of a recording segment. The format is taken from the extension
+    of `path` (.csv, .parquet, .h5/.hdf5 or .npz).
+
+    Parameters:
+    -----------
+    data: dict
+        Column name -> 1d array, e.g. {"raw_405nm": ..., "raw_465nm": ..., "dff": ...}
+    path: str
+        Path of the file to write.
+    sampling_frequency: float
+        Sampling frequency of the columns. Saved as metadata.
+    start_datetime: datetime
+        Start of the segment. Saved as metadata.
+    compression: str or None
+        Compression of the binary formats. "default" uses `SEGMENT_COMPRESSION`,
+        None writes uncompressed files, which `load_segment` memory-maps.
+    **metadata:
+        Additional metadata, must be json serializable. Ignored for csv.
+
+    Returns:
+    --------
+    path: str
+        Path of the written file.
+    """
+    file_format = _segment_format(path)
+    if compression == "default":
+        compression = SEGMENT_COMPRESSION.get(file_format)
+    metadata = dict(metadata)
+    if sampling_frequency is not None:
+        metadata["sampling_frequency"] = float(sampling_frequency)
+    if start_datetime is not None:
+        metadata["start_datetime"] = start_datetime.isoformat()
+    SEGMENT_WRITERS[file_format](data, path, metadata, compression)
+    return path
+
+
+def load_segment(path: str) -> Tuple[Dict[str, np.array], Dict[str, Any]]:
+    """Loads a segment saved by `save_segment`.
+
+    Columns of uncompressed hdf5 and npz files are memory-mapped, i.e. they are
+    read-only views of the file and nothing is read until it is used. Parquet columns
+    are handed over from Arrow to NumPy without copies. Compressed files are
+    decompressed once.
+
+    Example:
+    >>> data, metadata = fp.load_segment("analysis/fiber_data_20241129_101010_10_3600.parquet")
+    >>> dff = data["dff"]
+    >>> fs = metadata["sampling_frequency"]
+
+    Returns:
+    --------
+    data: dict
+        Column name -> 1d array
+    metadata: dict
+        Metadata saved with the segment. "start_datetime" is returned as datetime.
+    """
+    data, metadata = SEGMENT_READERS[_segment_format(path)](path)
+    if "start_datetime" in metadata:
+        metadata["start_datetime"] = datetime.fromisoformat(metadata["start_datetime"])
+    return data, metadata
+
+
+def _segment_format(path: str) -> str:
+    """Returns the segment format of a file from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    file_format = {".h5": "hdf5", ".hdf5": "hdf5"}.get(extension, extension[1:])
+    if file_format not in SEGMENT_WRITERS:
+        raise ValueError(
+            f"Unknown segment format: {extension}. Use one of {list(SEGMENT_WRITERS)}"
+        )
+    return file_format
+
+
+def _write_csv(data, path, metadata, compression):
+    pd.DataFrame.from_dict(data).to_csv(path, index=False)
+
+
+def _read_csv(path):
+    df = pd.read_csv(path)
+    return {column: df[column].to_numpy() for column in df.columns}, {}
+
+
+def _write_parquet(data, path, metadata, compression):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.table({k: np.asarray(v, dtype=np.float32) for k, v in data.items()})
+    table = table.replace_schema_metadata({_SEGMENT_METADATA_KEY: json.dumps(metadata)})
+    # a single row group keeps every column in one contiguous chunk
+    pq.write_table(
+        table,
+        path,
+        compression=compression or "none",
+        row_group_size=max(table.num_rows, 1),
+    )
+
+
+def _read_parquet(path):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, memory_map=True)
+    data = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if column.num_chunks == 1:
+            data[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            data[name] = column.to_numpy()
+    metadata = (table.schema.metadata or {}).get(_SEGMENT_METADATA_KEY.encode(), b"{}")
+    return data, json.loads(metadata)
+
+
+def _write_hdf5(data, path, metadata, compression):
+    import h5py
+
+    with h5py.File(path, "w") as f:
+        for name, values in data.items():
+            f.create_dataset(
+                name, data=np.asarray(values, dtype=np.float32), compression=compression
+            )
+        f.attrs[_SEGMENT_METADATA_KEY] = json.dumps(metadata)
+
+
+def _read_hdf5(path):
+    import h5py
+
+    data = {}
+    with h5py.File(path, "r") as f:
+        for name, dataset in f.items():
+            offset = dataset.id.get_offset()
+            if dataset.compression is None and offset is not None:
+                data[name] = np.memmap(
+                    path, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape
+                )
+            else:
+                data[name] = dataset[()]
+        metadata = json.loads(f.attrs.get(_SEGMENT_METADATA_KEY, "{}"))
+    return data, metadata
+
+
+def _write_npz(data, path, metadata, compression):
+    arrays = {k: np.asarray(v, dtype=np.float32) for k, v in data.items()}
+    arrays[_SEGMENT_METADATA_KEY] = np.array(json.dumps(metadata))
+    if compression is None:
+        np.savez(path, **arrays)
+    else:
+        np.savez_compressed(path, **arrays)
+
+
+def _read_npz(path):
+    data = {}
+    with np.load(path) as npz, zipfile.ZipFile(path) as archive:
+        metadata = json.loads(str(npz[_SEGMENT_METADATA_KEY]))
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")]
+            if name == _SEGMENT_METADATA_KEY:
+                continue
+            if info.compress_type == zipfile.ZIP_STORED:
+                data[name] = _memmap_npz_member(path, info)
+            else:
+                data[name] = npz[name]
+    return data, metadata
+
+
+def _memmap_npz_member(path: str, info: zipfile.ZipInfo) -> np.memmap:
+    """Memory-maps an uncompressed .npy member of a .npz archive."""
+    with open(path, "rb") as f:
+        # local file header: 30 bytes, then file name and extra field
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(f.read(4), dtype="<u2")
+        f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        if np.lib.format.read_magic(f) == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+SEGMENT_WRITERS = {
+    "csv": _write_csv,
+    "parquet": _write_parquet,
+    "hdf5": _write_hdf5,
+    "npz": _write_npz,
+}
+SEGMENT_READERS = {
+    "csv": _read_csv,
+    "parquet": _read_parquet,
+    "hdf5": _read_hdf5,
+    "npz": _read_npz,
+}
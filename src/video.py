@@ -5,54 +5,102 @@ gt2253@cumc.columbia.edu
 gt2253@cumc.columbia.edu
 """
 
+from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import cached_property
+import itertools
 import os
-from os.path import join
+import threading
 from enum import Enum
-from .FreezeAnalysis import create_video_dict
+
+import numpy as np
+
+from . import logging_module as lm
+from .FreezeAnalysis import (
+    CropSpec,
+    FrameSource,
+    MotionKernel,
+    _crop_mask,
+    create_video_dict,
+    prepare_frame,
+)
+from .video_index import frame_count, frame_index
 
 
 from cv2 import (
     CAP_PROP_FPS,
-    CAP_PROP_FRAME_COUNT,
     CAP_PROP_FRAME_HEIGHT,
     CAP_PROP_FRAME_WIDTH,
-    CAP_PROP_POS_FRAMES,
     VideoCapture,
     VideoWriter,
     VideoWriter_fourcc,
 )
 
 
-@dataclass
-class UsbVideo:
-    """Video class to handle video files recored with USB camera.
-    Initialize with the path to the video file.
+class CapturePool:
+    """Pool of open `cv2.VideoCapture` objects, so that repeated access to the same
+    videos does not reopen them. Captures are borrowed with `capture`, a context
+    manager, and returned to the pool afterwards. At most `max_idle` idle captures
+    are kept; the least recently used ones are released first.
 
     Parameters:
     -----------
-    vid_path: str
-        Path to the video file.
-    dsmpl: int
-        Downsampling factor.
-    width: int
-        Width of the video.
-    height: int
-        Height of the video.
-    start: int
-        Start frame.
-    end: int
-        End frame.
-    preCue_onset: int
-        Frames before cue onset. If None, will be calculated as seconds4Cue * fps.
-        If not None, needs to be an integer that represents total frames.
-    postCue_onset: int
-        Frames after cue onset. If None, will be calculated as seconds4Cue * fps.
-        If not None, needs to be an integer that represents total frames.
-    seconds4Cue: int
-        Seconds before and after cue onset. If preCue_onset and postCue_onset are
-        not None, will be ignored.
+    max_idle: int
+        Maximum number of idle captures kept open, over all videos.
+
+    Example:
+    >>> with CAPTURE_POOL.capture("path/to/video.avi") as cap:
+    ...     ret, frame = cap.read()"""
+
+    def __init__(self, max_idle: int = 8):
+        self.max_idle = max_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
 
+    @contextmanager
+    def capture(self, vid_path: str):
+        """Borrows a capture of `vid_path`. Its position is wherever the previous
+        borrower left it, so seek before reading."""
+        cap = None
+        with self._lock:
+            for entry in self._idle:
+                if entry[0] == vid_path:
+                    self._idle.remove(entry)
+                    cap = entry[1]
+                    break
+        if cap is None:
+            cap = VideoCapture(vid_path)
+        try:
+            yield cap
+        finally:
+            evicted = []
+            with self._lock:
+                if cap.isOpened():
+                    self._idle.append((vid_path, cap))
+                else:
+                    evicted.append(cap)
+                while len(self._idle) > self.max_idle:
+                    evicted.append(self._idle.popleft()[1])
+            for cap in evicted:
+                cap.release()
+
+    def clear(self) -> None:
+        """Releases all idle captures."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for _, cap in idle:
+            cap.release()
+
+
+CAPTURE_POOL = CapturePool()
+
+
+@dataclass
+class UsbVideo:
+    """Video class to handle video files recored with USB camera.
+    Initialize with the path to the video file. Construction does not open the
+    video; metadata is probed on first access and cached.
 
     Parameters:
     -----------
@@ -90,54 +138,44 @@ class UsbVideo:
     preCue_onset: int = None
     postCue_onset: int = None
     seconds4Cue: int = 30
-    dsmpl: int = 1
-    width: int = 1
-    height: int = 1
-    start: int = 0
-    end: int = None
-    preCue_onset: int = None
-    postCue_onset: int = None
-    seconds4Cue: int = 30
 
     def __post_init__(self):
-        """Reads in all the data from tdt recording.
-        f_path: str
-            Path to the folder containing data."""
-        self.video = VideoCapture(self.vid_path)
-        self.sessFolder = os.path.dirname(self.vid_path)
+        """Sets the session folder. The video itself is opened lazily."""
         self.sessFolder = os.path.dirname(self.vid_path)
 
-    @property
-    def video_params(self) -> dict:
-        """Returns the parameters of the recorded video."""
-        params = {}
-        cap = self.video
-        if cap.isOpened():
-            # get cap property
-            params["width"] = cap.get(CAP_PROP_FRAME_WIDTH)  # float `width`
-            params["height"] = cap.get(CAP_PROP_FRAME_HEIGHT)  # float `height`
-            params["fps"] = cap.get(CAP_PROP_FPS)
-            params["frame_count"] = cap.get(CAP_PROP_FRAME_COUNT)
-        cap.release()
-
-        self.fps = int(params["fps"])
+    def capture(self):
+        """Context manager that borrows a capture of the video from `CAPTURE_POOL`."""
+        return CAPTURE_POOL.capture(self.vid_path)
 
-        if self.preCue_onset is not None and self.postCue_onset is not None:
-            self.seconds4Cue = None
-        else:
-            self.preCue_onset = (
-                int(self.fps * self.seconds4Cue)
-                if self.preCue_onset is None
-                else self.preCue_onset
-            )
-            self.postCue_onset = (
-                int(self.fps * self.seconds4Cue)
-                if self.postCue_onset is None
-                else self.postCue_onset
-            )
+    @cached_property
+    def video(self) -> VideoCapture:
+        """`cv2.VideoCapture` of the video, opened on first access and owned by this
+        object (it is not shared through `CAPTURE_POOL`)."""
+        return VideoCapture(self.vid_path)
 
+    @cached_property
+    def metadata(self) -> dict:
+        """Width, height, fps and frame count of the video, probed once. The frame
+        count is exact if the video has been indexed (see `video_index`)."""
+        with self.capture() as cap:
+            if not cap.isOpened():
+                raise OSError(f"Could not open video {self.vid_path}")
+            return {
+                "width": cap.get(CAP_PROP_FRAME_WIDTH),
+                "height": cap.get(CAP_PROP_FRAME_HEIGHT),
+                "fps": cap.get(CAP_PROP_FPS),
+                "frame_count": float(frame_count(self.vid_path, cap)),
+            }
 
-        self.fps = int(params["fps"])
+    @cached_property
+    def fps(self) -> int:
+        """Frames per second of the video."""
+        return int(self.metadata["fps"])
+
+    @property
+    def video_params(self) -> dict:
+        """Returns the parameters of the recorded video."""
+        params = dict(self.metadata)
 
         if self.preCue_onset is not None and self.postCue_onset is not None:
             self.seconds4Cue = None
@@ -167,20 +205,15 @@ class UsbVideo:
             fps=self.fps,
         )
 
-    @property
-    def video_create4FreezeAnalysis(self) -> dict:
-        return create_video_dict(
-            video_path=self.vid_path,
-            start=self.start,
-            end=self.end,
-            dsmpl=self.dsmpl,
-            width=self.width,
-            height=self.height,
-            fps=self.fps,
-        )
-
-    def slice_video(self, start: int, end: int, codec: str) -> None:
-        """Slices the video between start and end frames.
+    def slice_video(
+        self,
+        start: int,
+        end: int,
+        codec: str = "MJPG",
+        save_path: str = None,
+        method: str = "auto",
+    ) -> str:
+        """Saves frames `start` to `end` (inclusive) of the video as a new clip.
         Parameters:
         -----------
         start: int
@@ -188,54 +221,297 @@ class UsbVideo:
         end: int
             End frame.
         codec: str
-            Codec to use for saving the video.
+            Codec to use for saving the video when frames are re-encoded.
             e.g. "MJPG" or "XVID"
-        """
-        cap = self.video
-        save_path = self.vid_path.split(".")[0]
+        save_path: str
+            Path of the clip. Defaults to the video path with a "_sliced" suffix.
+        method: str
+            "copy" copies the compressed frames without re-encoding, which is
+            lossless and does not decode anything. Needs the optional `av` (PyAV)
+            package, a keyframe at `start` and one after `end` (or `end` being the
+            last frame), otherwise a ValueError is raised. "decode" seeks to the
+            keyframe before `start`, decodes only the requested range and
+            re-encodes it with `codec`. "auto" copies when the cut points line up
+            with keyframes and decodes otherwise.
 
+        Returns:
+        --------
+        str
+            Path of the saved clip.
+        """
         # validate input
         if start < 0:
             raise ValueError("Start frame must be non-negative.")
         if end < start:
             raise ValueError("End frame must be greater than or equal to start frame.")
-        total_frames = int(cap.get(CAP_PROP_FRAME_COUNT))
+        total_frames = int(self.metadata["frame_count"])
+        w_frame, h_frame = int(self.metadata["width"]), int(self.metadata["height"])
+        fps = self.metadata["fps"]
         if end >= total_frames:
             raise ValueError(
                 f"End frame must be less than total frames ({total_frames})."
             )
+        if method in ("auto", "copy"):
+            aligned = _cuts_on_keyframes(self.vid_path, start, end)
+            if method == "copy" and not aligned:
+                raise ValueError(
+                    "Stream copy needs PyAV and keyframes at the cut points. "
+                    "Use method='decode' or 'auto'."
+                )
+            method = "copy" if aligned else "decode"
 
-        # setup the video writer
-        w_frame, h_frame = (
-            int(cap.get(CAP_PROP_FRAME_WIDTH)),
-            int(cap.get(CAP_PROP_FRAME_HEIGHT)),
-        )
-        w_frame, h_frame = (
-            int(cap.get(CAP_PROP_FRAME_WIDTH)),
-            int(cap.get(CAP_PROP_FRAME_HEIGHT)),
-        )
-        fps = cap.get(CAP_PROP_FPS)
-        cap.set(CAP_PROP_POS_FRAMES, start)
+        root, ext = os.path.splitext(self.vid_path)
+        if method == "copy":
+            save_path = save_path or f"{root}_sliced{ext}"
+            _copy_clip(self.vid_path, save_path, start, end)
+        elif method == "decode":
+            save_path = save_path or f"{root}_sliced.avi"
+            fourcc = VideoWriter_fourcc(*codec)
+            out = VideoWriter(save_path, fourcc, fps, (w_frame, h_frame))
+            frames = FrameSource(self.vid_path, start, end + 1, gray=False)
+            try:
+                for frame in frames:
+                    out.write(frame)
+            finally:
+                frames.close()
+                out.release()
+        else:
+            raise ValueError(f"Unknown method {method!r}. Use auto, copy or decode.")
+        return save_path
+
+    def extract_cue_clips(
+        self,
+        cue_times,
+        offset: float = 0,
+        codec: str = "MJPG",
+        save_dir: str = None,
+        mt_cutoff: float = None,
+        SIGMA: float = 1,
+        crop=None,
+    ) -> list:
+        """Saves a clip around every cue, from `preCue_onset` frames before to
+        `postCue_onset` frames after the cue, in one sequential pass over the video.
+        Frames between clips are decoded but not converted, and overlapping clips
+        share their frames.
+        Parameters:
+        -----------
+        cue_times: list
+            Cue times in seconds, e.g. TDT `PtC0` epoc onsets.
+        offset: float
+            Seconds added to every cue time to convert it to video time.
+        codec: str
+            Codec to use for saving the clips. e.g. "MJPG" or "XVID"
+        save_dir: str
+            Folder of the clips. Defaults to the folder of the video. Clips are named
+            after the video with a "_cue<index>" suffix.
+        mt_cutoff: float
+            If given, `Measure_Motion` values are computed for every clip in the same
+            pass, using `dsmpl` of the video.
+        SIGMA: float
+            Sigma value for the gaussian filter of the motion measurement.
+        crop: CropSpec, holoviews.streams.BoxEdit, tuple or str
+            Crop used for the motion measurement, see `FreezeAnalysis.CropSpec`. As
+            in `Measure_Motion`, only pixels inside a polygon crop are counted.
+
+        Returns:
+        --------
+        list of CueClip
+            One entry per cue, in the order of `cue_times`. Clips are cut at the last
+            readable frame of the video; a clip that starts after it, or of a cue
+            outside the video, is not written and has no path.
+        """
+        if self.preCue_onset is None or self.postCue_onset is None:
+            self.video_params  # sets the cue windows
+        total_frames = int(self.metadata["frame_count"])
+        w_frame, h_frame = int(self.metadata["width"]), int(self.metadata["height"])
+        fps = self.metadata["fps"]
+
+        name = os.path.splitext(os.path.basename(self.vid_path))[0]
+        save_dir = save_dir or self.sessFolder
+        clips = []
+        for i, cue in enumerate(cue_times):
+            cue_frame = int(round((cue + offset) * self.fps))
+            start = max(0, cue_frame - self.preCue_onset)
+            end = min(total_frames, cue_frame + self.postCue_onset)
+            if end <= start:
+                lm.log_warning(f"Cue at {cue} s lies outside the video, skipping it.")
+                clips.append(CueClip(cue, start, start, None))
+                continue
+            path = os.path.join(save_dir, f"{name}_cue{i:02d}.avi")
+            clips.append(CueClip(cue, start, end, path))
+        pending = [clip for clip in clips if clip.path is not None]
+        if not pending:
+            return clips
+
+        # single pass from the first to the last clip frame
+        first = min(clip.start for clip in pending)
+        last = max(clip.end for clip in pending)
+        retrieve = np.zeros(last - first, dtype=bool)
+        for clip in pending:
+            retrieve[clip.start - first : clip.end - first] = True
+        crop = CropSpec.from_crop(crop)
+        box = None if crop is None else crop.bounding_box()
+        mask = _crop_mask(crop, h_frame, w_frame, self.dsmpl)
         fourcc = VideoWriter_fourcc(*codec)
-        out = VideoWriter(
-            join(save_path, "_sliced.avi"), fourcc, fps, (w_frame, h_frame)
-        )
-        counter = 0
-        # read until the 'end'
+        writers, kernels = {}, {}
+        readable = last
+        frames = FrameSource(self.vid_path, first, last, gray=False, retrieve=retrieve)
         try:
-            while cap.isOpened() and counter <= end:
-                ret, frame = cap.read()
-                counter += 1
-                if ret:
-                    if counter >= start:
-                        out.write(frame)
-                else:
+            for index in range(first, last):
+                ret, frame = frames.read()
+                if not ret:
+                    readable = index
                     break
-        except Exception as error:
-            print(f"Error occured: {error}")
+                if frame is None:
+                    continue
+                active = [clip for clip in pending if clip.start <= index < clip.end]
+                if mt_cutoff is not None:
+                    gray = prepare_frame(frame, self.dsmpl, box)
+                for clip in active:
+                    if index == clip.start:
+                        writers[id(clip)] = VideoWriter(
+                            clip.path, fourcc, fps, (w_frame, h_frame)
+                        )
+                        if mt_cutoff is not None:
+                            clip.motion = np.zeros(clip.end - clip.start)
+                            kernel = MotionKernel(mt_cutoff, SIGMA, mask=mask)
+                            kernel.reset(gray)
+                            kernels[id(clip)] = kernel
+                    elif mt_cutoff is not None:
+                        clip.motion[index - clip.start] = kernels[id(clip)](gray)
+                    writers[id(clip)].write(frame)
+                    if index == clip.end - 1:
+                        writers.pop(id(clip)).release()
+                        kernels.pop(id(clip), None)
         finally:
-            cap.release()
-            out.release()
+            frames.close()
+            for writer in writers.values():
+                writer.release()
+
+        # clips cut short by the end of the readable video
+        for clip in clips:
+            if clip.start >= readable:
+                clip.end, clip.path = clip.start, None
+            elif clip.end > readable:
+                clip.end = readable
+                if clip.motion is not None:
+                    clip.motion = clip.motion[: clip.end - clip.start]
+        return clips
+
+
+@dataclass
+class CueClip:
+    """Peri-cue clip written by `UsbVideo.extract_cue_clips`.
+
+    Parameters:
+    -----------
+    cue: float
+        Cue time in seconds, as passed.
+    start: int
+        First frame of the clip in the video.
+    end: int
+        Frame after the last frame of the clip in the video.
+    path: str
+        Path of the clip. None if the clip was not written, because the cue lies
+        outside the video or the video could not be read up to its start.
+    motion: np.ndarray
+        Motion values of the clip frames (see `FreezeAnalysis.Measure_Motion`), if
+        requested."""
+
+    cue: float
+    start: int
+    end: int
+    path: str
+    motion: np.ndarray = None
+
+
+def _frame_pts(stream, index: int, vid_path: str = None) -> int:
+    """Presentation timestamp of frame `index`. Taken from the frame index of the
+    video if present, otherwise computed for a constant frame rate stream."""
+    frames = frame_index(vid_path)
+    if frames is not None and index < frames.frame_count:
+        return int(frames.pts[index])
+    if stream.average_rate is None or stream.time_base is None:
+        raise ValueError("Frame rate of the video stream is unknown.")
+    start = stream.start_time or 0
+    return start + int(round(index / (stream.average_rate * stream.time_base)))
+
+
+def _cuts_on_keyframes(vid_path: str, start: int, end: int) -> bool:
+    """Whether frame `start` and the frame after `end` are keyframes, and no frame up
+    to `end` is decoded after the keyframe that follows it (as B-frames referring
+    to it are), so that the clip can be stream copied. False if PyAV is not
+    installed or if this cannot be verified, e.g. the number of frames is unknown."""
+    try:
+        import av
+    except ImportError:
+        return False
+    frames = frame_index(vid_path)
+    if frames is not None and frames.keyframe is not None:
+        if end + 1 >= frames.frame_count:
+            return bool(frames.keyframe[start])
+        # packets are stored in decoding order
+        offsets = frames.offset[start : end + 2]
+        return (
+            bool(frames.keyframe[start])
+            and bool(frames.keyframe[end + 1])
+            and offsets.min() >= 0
+            and offsets[:-1].max() < offsets[-1]
+        )
+    try:
+        with av.open(vid_path) as container:
+            stream = container.streams.video[0]
+            if not stream.frames or start >= stream.frames:
+                return False
+            for index in (start, end + 1):
+                if index >= stream.frames:
+                    continue
+                pts = _frame_pts(stream, index, vid_path)
+                container.seek(pts, stream=stream, backward=True, any_frame=False)
+                packets = (p for p in container.demux(stream) if p.pts is not None)
+                packet = next(packets)
+                if packet.pts != pts or not packet.is_keyframe:
+                    return False
+                if index == end + 1:
+                    # frames decoded after the keyframe up to the next reference
+                    # frame must follow it in display order
+                    for packet in itertools.islice(packets, 16):
+                        if packet.pts < pts:
+                            return False
+                        if packet.pts > pts:
+                            break
+    except (av.FFmpegError, StopIteration, ValueError):
+        return False
+    return True
+
+
+def _copy_clip(vid_path: str, save_path: str, start: int, end: int) -> int:
+    """Copies the packets of frames `start` to `end` into a new container without
+    decoding them. Returns the number of frames copied. Packets come in decoding
+    order, which differs from display order with B-frames, so every packet is
+    filtered by its presentation timestamp and the copy stops at the first packet
+    decoded after `end`."""
+    import av
+
+    copied = 0
+    with av.open(vid_path) as source, av.open(save_path, "w") as clip:
+        stream = source.streams.video[0]
+        clip_stream = clip.add_stream_from_template(stream)
+        first = _frame_pts(stream, start, vid_path)
+        last = _frame_pts(stream, end, vid_path)
+        source.seek(first, stream=stream, backward=True, any_frame=False)
+        for packet in source.demux(stream):
+            if packet.dts is not None and packet.dts > last:
+                break
+            if packet.pts is None or not first <= packet.pts <= last:
+                continue
+            packet.pts -= first
+            if packet.dts is not None:
+                packet.dts -= first
+            packet.stream = clip_stream
+            clip.mux(packet)
+            copied += 1
+    return copied
 
 
 class Params4Motion(Enum):
@@ -0,0 +1,292 @@
+"""
+Frame index sidecar files for videos.
+
+A video is scanned once with `index_video`, which stores the presentation timestamp,
+byte offset, packet size and keyframe flag of every frame in a sidecar file next to
+the video (`<video>.frameindex.npz`). `frame_index` returns the index of a video if
+its sidecar exists and still matches the size and modification time of the video.
+Frame counts and seeks in `FreezeAnalysis` and `video` use the index when present:
+counts are exact, and a seek jumps straight to the closest preceding keyframe and
+grabs forward from there.
+
+Results of checks of a video that are slow to repeat, e.g. the p-frame check of
+`FreezeAnalysis.check_p_frames`, are kept in a second sidecar
+(`<video>.checks.json`) with `save_check` and read back with `load_check` as long as
+the video is unchanged.
+"""
+
+from dataclasses import dataclass, field
+import json
+import os
+
+import cv2
+import numpy as np
+
+SIDECAR_SUFFIX = ".frameindex.npz"
+CHECKS_SUFFIX = ".checks.json"
+_INDEX_VERSION = 1
+_INDEX_CACHE = {}
+
+
+@dataclass
+class FrameIndex:
+    """Per-frame index of a video, in display order.
+
+    Parameters:
+    -----------
+    fpath: str
+        Path to the video file.
+    pts: np.ndarray
+        Presentation timestamp of every frame, in units of `time_base`.
+    time_base: float
+        Duration of one timestamp unit in seconds.
+    offset: np.ndarray
+        Byte offset of the packet of every frame in the file, -1 if unknown.
+    size: np.ndarray
+        Size of the packet of every frame in bytes, -1 if unknown.
+    keyframe: np.ndarray
+        Whether every frame is a keyframe. None if the video was indexed without
+        PyAV, in which case keyframes are unknown."""
+
+    fpath: str
+    pts: np.ndarray
+    time_base: float
+    offset: np.ndarray
+    size: np.ndarray
+    keyframe: np.ndarray = None
+    _previous_key: np.ndarray = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.keyframe is not None:
+            frames = np.arange(len(self.pts))
+            self._previous_key = np.maximum.accumulate(
+                np.where(self.keyframe, frames, 0)
+            )
+
+    @property
+    def frame_count(self) -> int:
+        """Exact number of frames."""
+        return len(self.pts)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Presentation time of every frame in seconds."""
+        return (self.pts - self.pts[0]) * self.time_base
+
+    @property
+    def keyframes(self) -> np.ndarray:
+        """Indices of the keyframes."""
+        if self.keyframe is None:
+            return None
+        return np.flatnonzero(self.keyframe)
+
+    def keyframe_before(self, frame: int) -> int:
+        """Index of the last keyframe at or before `frame`."""
+        if self._previous_key is None:
+            return frame
+        return int(self._previous_key[min(frame, self.frame_count - 1)])
+
+    def seek(self, cap, frame: int) -> None:
+        """Positions `cap` so that its next read returns `frame`: seeks to the last
+        keyframe at or before `frame` and grabs the frames in between."""
+        key = self.keyframe_before(frame)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, key)
+        for _ in range(frame - key):
+            cap.grab()
+
+
+def sidecar_path(fpath: str) -> str:
+    """Path of the frame index sidecar of a video."""
+    return fpath + SIDECAR_SUFFIX
+
+
+def index_video(fpath: str, save: bool = True) -> FrameIndex:
+    """Scans a video and returns its frame index, saving it as a sidecar file.
+
+    With the optional `av` (PyAV) package, packets are demuxed without decoding and
+    keyframes, byte offsets and packet sizes are recorded. Otherwise every frame is
+    grabbed with OpenCV, which gives exact counts and timestamps only.
+
+    Parameters:
+    -----------
+    fpath: str
+        Path to the video file.
+    save: bool
+        Whether to write the sidecar file.
+
+    Returns:
+    --------
+    FrameIndex
+    """
+    stat = os.stat(fpath)
+    try:
+        import av
+    except ImportError:
+        av = None
+    if av is not None:
+        index = _index_packets(av, fpath)
+    else:
+        index = _index_grab(fpath)
+    if save:
+        arrays = dict(
+            pts=index.pts,
+            time_base=index.time_base,
+            offset=index.offset,
+            size=index.size,
+            video_size=stat.st_size,
+            video_mtime_ns=stat.st_mtime_ns,
+            version=_INDEX_VERSION,
+        )
+        if index.keyframe is not None:
+            arrays["keyframe"] = index.keyframe
+        path = sidecar_path(fpath)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    _INDEX_CACHE[(os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns)] = index
+    return index
+
+
+def frame_index(fpath: str) -> FrameIndex:
+    """Returns the frame index of a video from its sidecar file, or None if the video
+    has not been indexed or has changed since. Loaded indices are cached."""
+    try:
+        stat = os.stat(fpath)
+    except (OSError, TypeError):
+        return None
+    key = (os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns)
+    if key not in _INDEX_CACHE:
+        path = sidecar_path(fpath)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as sidecar:
+            if (
+                int(sidecar["version"]) != _INDEX_VERSION
+                or int(sidecar["video_size"]) != stat.st_size
+                or int(sidecar["video_mtime_ns"]) != stat.st_mtime_ns
+            ):
+                return None
+            _INDEX_CACHE[key] = FrameIndex(
+                fpath,
+                pts=sidecar["pts"],
+                time_base=float(sidecar["time_base"]),
+                offset=sidecar["offset"],
+                size=sidecar["size"],
+                keyframe=sidecar["keyframe"] if "keyframe" in sidecar else None,
+            )
+    return _INDEX_CACHE[key]
+
+
+def checks_path(fpath: str) -> str:
+    """Path of the check results sidecar of a video."""
+    return fpath + CHECKS_SUFFIX
+
+
+def load_check(fpath: str, name: str):
+    """Returns the result of check `name` of a video saved with `save_check`, or None
+    if there is none or the video has changed since."""
+    checks = _load_checks(fpath, os.stat(fpath))
+    return checks.get(name)
+
+
+def save_check(fpath: str, name: str, result) -> bool:
+    """Saves the result of check `name` of a video, which must be json serializable,
+    in its check results sidecar. Results of other checks are kept unless the video
+    has changed. Returns False if the sidecar cannot be written, e.g. next to videos
+    in a read-only directory."""
+    stat = os.stat(fpath)
+    checks = _load_checks(fpath, stat)
+    checks[name] = result
+    sidecar = dict(
+        video_size=stat.st_size,
+        video_mtime_ns=stat.st_mtime_ns,
+        version=_INDEX_VERSION,
+        checks=checks,
+    )
+    path = checks_path(fpath)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(sidecar, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        return False
+    return True
+
+
+def _load_checks(fpath, stat):
+    try:
+        with open(checks_path(fpath)) as f:
+            sidecar = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (
+        sidecar.get("version") != _INDEX_VERSION
+        or sidecar.get("video_size") != stat.st_size
+        or sidecar.get("video_mtime_ns") != stat.st_mtime_ns
+    ):
+        return {}
+    return sidecar.get("checks", {})
+
+
+def frame_count(fpath: str, cap=None) -> int:
+    """Number of frames of a video: exact if it has been indexed, otherwise as
+    reported by OpenCV (using `cap` if given)."""
+    index = frame_index(fpath)
+    if index is not None:
+        return index.frame_count
+    if cap is not None:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap = cv2.VideoCapture(fpath)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+
+def seek_frame(cap, fpath: str, frame: int) -> None:
+    """Positions `cap`, a capture of `fpath`, so that its next read returns `frame`.
+    Uses the frame index of the video if present."""
+    index = frame_index(fpath)
+    if index is not None:
+        index.seek(cap, frame)
+    else:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+
+
+def _index_packets(av, fpath):
+    pts, offset, size, keyframe = [], [], [], []
+    with av.open(fpath) as container:
+        stream = container.streams.video[0]
+        time_base = float(stream.time_base)
+        for packet in container.demux(stream):
+            if packet.dts is None and packet.size == 0:
+                continue  # flush packet at end of stream
+            pts.append(packet.pts if packet.pts is not None else packet.dts)
+            offset.append(packet.pos if packet.pos is not None else -1)
+            size.append(packet.size)
+            keyframe.append(packet.is_keyframe)
+    order = np.argsort(np.asarray(pts, dtype=np.int64), kind="stable")
+    return FrameIndex(
+        fpath,
+        pts=np.asarray(pts, dtype=np.int64)[order],
+        time_base=time_base,
+        offset=np.asarray(offset, dtype=np.int64)[order],
+        size=np.asarray(size, dtype=np.int64)[order],
+        keyframe=np.asarray(keyframe, dtype=bool)[order],
+    )
+
+
+def _index_grab(fpath):
+    cap = cv2.VideoCapture(fpath)
+    pts = []
+    while cap.grab():
+        pts.append(round(cap.get(cv2.CAP_PROP_POS_MSEC) * 1000))
+    cap.release()
+    unknown = np.full(len(pts), -1, dtype=np.int64)
+    return FrameIndex(
+        fpath,
+        pts=np.asarray(pts, dtype=np.int64),
+        time_base=1e-6,
+        offset=unknown,
+        size=unknown.copy(),
+    )
@@ -0,0 +1,91 @@
+"""Shared fixtures: small synthetic videos and TDT tanks written on the fly."""
+
+import os
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+TANK_FS = 1017.2526245117188
+TANK_DURATION = 120.0
+TANK_EPOCS = ((5, 20), (30, 60), (64, 110))
+
+
+def _tsq_header(size, event_type, code, channel, ts, offset, dform, fs, strobe=None):
+    header = struct.pack("<IIIHHd", size, event_type, code, channel, 0, ts)
+    if strobe is None:
+        header += struct.pack("<Q", offset)
+    else:
+        header += struct.pack("<d", strobe)
+    return header + struct.pack("<If", dform, fs)
+
+
+def _store_code(name):
+    return struct.unpack("<I", name.encode("cp437"))[0]
+
+
+def write_tank(path, duration=TANK_DURATION, fs=TANK_FS, epocs=TANK_EPOCS, seed=0):
+    """Writes a TDT tank (TSQ/TEV) with float32 streams `465A` and `405A` in blocks
+    of 256 samples and a strobed epoc store `TC1/` with `epocs` (onset, offset)."""
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start, samples_per_block = 1.7e9, 256
+    n_blocks = int(duration * fs / samples_per_block)
+    n = n_blocks * samples_per_block
+    signals = {
+        "465A": (100 + np.cumsum(rng.normal(size=n)) * 0.01).astype(np.float32),
+        "405A": (80 + np.cumsum(rng.normal(size=n)) * 0.01).astype(np.float32),
+    }
+    tev, events = bytearray(), []
+    for block in range(n_blocks):
+        ts = start + block * samples_per_block / fs
+        for name, signal in signals.items():
+            code, size = _store_code(name), 10 + samples_per_block
+            header = _tsq_header(size, 0x8101, code, 1, ts, len(tev), 0, fs)
+            first = block * samples_per_block
+            tev += signal[first : first + samples_per_block].tobytes()
+            events.append((ts, header))
+    for i, (onset, offset) in enumerate(epocs):
+        code = _store_code("TC1/")
+        for event_type, t in ((0x101, onset), (0x102, offset)):
+            header = _tsq_header(10, event_type, code, 0, start + t, 0, 4, 0, i + 1.0)
+            events.append((start + t, header))
+    events.sort(key=lambda event: event[0])
+    tsq = struct.pack("<qq", 0, 0) + b"\0" * 24
+    tsq += _tsq_header(10, 0x8801, 1, 0, start, 0, 0, 0)
+    tsq += b"".join(header for _, header in events)
+    tsq += _tsq_header(10, 0x8801, 2, 0, start + duration, 0, 0, 0)
+    name = os.path.basename(os.path.normpath(path))
+    with open(os.path.join(path, name + ".tsq"), "wb") as f:
+        f.write(tsq)
+    with open(os.path.join(path, name + ".tev"), "wb") as f:
+        f.write(tev)
+    return signals
+
+
+def write_video(path, n_frames=120, size=(160, 120), fps=30, fourcc="MJPG", seed=0):
+    """Writes a video of a bright square moving over a noisy background."""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    width, height = size
+    for i in range(n_frames):
+        frame = np.full((height, width, 3), 80, np.uint8)
+        x = (i * 3) % (width - 20)
+        frame[30:50, x : x + 17] = 230
+        frame += rng.integers(0, 20, frame.shape, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+@pytest.fixture(scope="session")
+def tank_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("tanks") / "Block-1")
+    write_tank(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def video_path(tmp_path_factory):
+    return write_video(str(tmp_path_factory.mktemp("videos") / "video.avi"))
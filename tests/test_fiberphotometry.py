@@ -0,0 +1,108 @@
+"""Segments of TDT recordings against full and windowed tdt.read_block reads."""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+from tdt import read_block
+
+import src.fiberphotometry as fp
+
+STORES = ["_465A", "_405A"]
+WINDOWS = [(0, 0), (10, 50), (0.3, 7.77), (33.1, 0), (100, 150)]
+
+
+@pytest.fixture(scope="module")
+def recording(tank_path):
+    return fp.ImportTDTData(tank_path=tank_path)
+
+
+@pytest.fixture(scope="module")
+def full_read(tank_path):
+    return read_block(tank_path, evtype=["streams"])
+
+
+def assert_same_streams(streams, direct):
+    for store in STORES:
+        np.testing.assert_array_equal(streams[store].data, direct[store].data)
+        assert streams[store].fs == direct[store].fs
+        assert streams[store].start_time == direct[store].start_time
+
+
+def test_lazy_read_matches_read_block(recording, full_read):
+    assert_same_streams(recording.data.streams, full_read.streams)
+
+
+@pytest.mark.parametrize("t1, t2", WINDOWS)
+def test_segment_matches_windowed_read(tank_path, recording, t1, t2):
+    direct = read_block(tank_path, t1=t1, t2=t2, evtype=["streams"])
+    segment = recording.segment(t1, t2)
+    assert_same_streams(segment.data.streams, direct.streams)
+    assert segment.kwargs["t1"] == t1 and segment.kwargs["t2"] == t2
+
+
+def test_segment_keeps_the_recording(recording, full_read):
+    recording.segment(10, 20)
+    assert_same_streams(recording.data.streams, full_read.streams)
+
+
+@pytest.mark.parametrize("method", ["tev", "window", "memory"])
+@pytest.mark.parametrize(
+    "duration, overlap, t1, t2", [(30, 0, 0, None), (25, 5, 3.3, 100), (200, 0, 0, 0)]
+)
+def test_chunks_match_windowed_reads(
+    tank_path, recording, method, duration, overlap, t1, t2
+):
+    chunks = list(recording.chunks(duration, overlap, t1, t2, method=method))
+    assert chunks
+    for chunk in chunks:
+        window = chunk.kwargs["t1"], chunk.kwargs["t2"]
+        direct = read_block(tank_path, t1=window[0], t2=window[1], evtype=["streams"])
+        assert_same_streams(chunk.data.streams, direct.streams)
+    assert chunks[0].kwargs["t1"] == t1
+    if t2:
+        assert chunks[-1].kwargs["t2"] == t2
+
+
+def test_chunks_cover_the_recording(recording, full_read):
+    chunks = list(recording.chunks(17, method="tev"))
+    for store in STORES:
+        joined = np.concatenate([chunk.data.streams[store].data for chunk in chunks])
+        np.testing.assert_array_equal(joined, full_read.streams[store].data)
+
+
+@pytest.mark.parametrize("duration, overlap", [(0, 0), (10, 10), (10, -1)])
+def test_chunks_reject_bad_windows(recording, duration, overlap):
+    with pytest.raises(ValueError):
+        recording.chunks(duration, overlap)
+
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet", ".h5", ".npz"])
+@pytest.mark.parametrize("compression", ["default", None])
+def test_segment_files_round_trip(tmp_path, recording, extension, compression):
+    if extension == ".parquet":
+        pytest.importorskip("pyarrow")
+    if extension == ".h5":
+        pytest.importorskip("h5py")
+    raw = recording.segment(10, 20).raw_data
+    data = {"raw_465nm": raw["dynamic"], "raw_405nm": raw["isos"]}
+    start = datetime(2024, 11, 29, 10, 10, 10)
+    path = fp.save_segment(
+        data,
+        str(tmp_path / ("segment" + extension)),
+        sampling_frequency=recording.sampling_frequency,
+        start_datetime=start,
+        compression=compression,
+        segment=3,
+    )
+    loaded, metadata = fp.load_segment(path)
+    assert set(loaded) == set(data)
+    for name, column in data.items():
+        if extension == ".csv":
+            np.testing.assert_allclose(loaded[name], column, rtol=1e-6)
+        else:
+            np.testing.assert_array_equal(loaded[name], column)
+    if extension != ".csv":
+        assert metadata["sampling_frequency"] == recording.sampling_frequency
+        assert metadata["start_datetime"] == start
+        assert metadata["segment"] == 3
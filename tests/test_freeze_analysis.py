@@ -0,0 +1,270 @@
+"""FreezeAnalysis results against the original per-frame implementations."""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import src.FreezeAnalysis as fz
+
+
+def freezing_loop(Motion, FreezeThresh, MinDuration):
+    """Measure_Freezing before vectorization."""
+    BelowThresh = (Motion < FreezeThresh).astype(int)
+    CumThresh = np.zeros(len(Motion))
+    for x in range(1, len(Motion)):
+        if BelowThresh[x] == 1:
+            CumThresh[x] = CumThresh[x - 1] + BelowThresh[x]
+    Freezing = (CumThresh >= MinDuration).astype(int)
+    for x in range(len(Freezing) - 2, -1, -1):
+        if Freezing[x] == 0 and Freezing[x + 1] > 0 and Freezing[x + 1] < MinDuration:
+            Freezing[x] = Freezing[x + 1] + 1
+    Freezing = (Freezing > 0).astype(int)
+    return Freezing * 100
+
+
+def run_lengths_loop(mask):
+    lengths = np.zeros(len(mask), dtype=int)
+    x = 0
+    while x < len(mask):
+        if mask[x]:
+            stop = x
+            while stop < len(mask) and mask[stop]:
+                stop += 1
+            lengths[x:stop] = stop - x
+            x = stop
+        else:
+            x += 1
+    return lengths
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_run_lengths_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    mask = rng.random(rng.integers(0, 200)) < rng.random()
+    np.testing.assert_array_equal(fz.run_lengths(mask), run_lengths_loop(mask))
+
+
+def test_run_lengths_keeps_rows_apart():
+    mask = np.array([[False, True, True], [True, True, False]])
+    np.testing.assert_array_equal(fz.run_lengths(mask), [[0, 2, 2], [2, 2, 0]])
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_measure_freezing_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    Motion = rng.integers(0, 10, rng.integers(0, 120)).astype(float)
+    if len(Motion) and rng.random() < 0.2:
+        Motion[rng.integers(0, len(Motion))] = np.nan
+    FreezeThresh = rng.choice([0, 3, 5, 7.5, 11])
+    MinDuration = rng.choice([-1, 0, 0.5, 1, 2, 2.5, 3, 5, np.inf])
+    expected = freezing_loop(Motion, FreezeThresh, MinDuration)
+    result = fz.Measure_Freezing(Motion, FreezeThresh, MinDuration)
+    assert result.dtype == expected.dtype
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_freezing_sweep_matches_single_calls():
+    Motion = np.random.default_rng(0).integers(0, 10, 500).astype(float)
+    thresholds, durations = [0, 3, 5, 7.5], [-1, 0, 0.5, 2, 3, np.inf]
+    sweep = fz.Measure_Freezing_Sweep(Motion, thresholds, durations)
+    for i, FreezeThresh in enumerate(thresholds):
+        for j, MinDuration in enumerate(durations):
+            expected = freezing_loop(Motion, FreezeThresh, MinDuration)
+            np.testing.assert_array_equal(sweep[i, j], expected)
+
+
+def video_dict(path, start=0, end=None, dsmpl=1, crop=None):
+    return {"fpath": path, "start": start, "end": end, "dsmpl": dsmpl, "crop": crop}
+
+
+@pytest.mark.parametrize(
+    "start, end, dsmpl, crop",
+    [
+        (0, None, 1, None),
+        (7, 90, 0.5, None),
+        (0, 150, 1, (10, 100, 5, 140)),  # runs past the last frame
+    ],
+)
+def test_parallel_motion_matches_serial(video_path, start, end, dsmpl, crop):
+    serial = fz.Measure_Motion(video_dict(video_path, start, end, dsmpl, crop), 10)
+    parallel = fz.Measure_Motion(
+        video_dict(video_path, start, end, dsmpl, crop), 10, n_workers=3
+    )
+    assert serial[0] == 0
+    if end is not None and end > 120:
+        assert len(serial) < end - start  # truncated at the first unreadable frame
+    np.testing.assert_array_equal(parallel, serial)
+
+
+def test_parallel_motion_matches_serial_with_rois(video_path):
+    rois = [(0, 60, 0, 80), (30, 120, 40, 160)]
+    serial = fz.Measure_Motion(video_dict(video_path), [5, 10], rois=rois)
+    parallel = fz.Measure_Motion(
+        video_dict(video_path), [5, 10], rois=rois, n_workers=2
+    )
+    np.testing.assert_array_equal(parallel, serial)
+
+
+def motion_float64(path, mt_cutoff, SIGMA=1):
+    """Measure_Motion before the float32 kernel: float64 blur and difference."""
+    cap = cv2.VideoCapture(path)
+    Motion, frame_old = [], None
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frame = cv2.GaussianBlur(frame.astype("float"), (0, 0), SIGMA)
+        if frame_old is None:
+            Motion.append(0)
+        else:
+            Motion.append(np.sum(np.absolute(frame - frame_old) > mt_cutoff))
+        frame_old = frame
+    cap.release()
+    return np.array(Motion, dtype=float)
+
+
+@pytest.mark.parametrize("mt_cutoff, SIGMA", [(10, 1), (4.5, 1), (20, 2)])
+def test_float32_motion_within_tolerance(video_path, mt_cutoff, SIGMA):
+    # documented in MotionKernel: at most one pixel per frame
+    expected = motion_float64(video_path, mt_cutoff, SIGMA)
+    result = fz.Measure_Motion(video_dict(video_path), mt_cutoff, SIGMA)
+    assert result.shape == expected.shape
+    assert np.max(np.abs(result - expected)) <= 1
+
+
+BINS = {
+    "first": (0, 30),
+    "middle": (25, 80),
+    "open start": (None, 12),
+    "open end": (90, None),
+    "negative": (-40, -10),
+    "before start": (-500, 20),
+    "past end": (100, 500),
+    "reversed": (50, 20),
+    "empty": (30, 30),
+}
+
+
+def summarize_loop(Motion, Freezing, bin_dict):
+    """Summarize bin means before the cumulative sums."""
+    motion = [Motion[slice(rng[0], rng[1])].mean() for rng in bin_dict.values()]
+    freezing = [Freezing[slice(rng[0], rng[1])].mean() for rng in bin_dict.values()]
+    return np.array(motion), np.array(freezing)
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice", "ignore:invalid value")
+def test_summarize_matches_slice_means():
+    rng = np.random.default_rng(0)
+    Motion = rng.integers(0, 50, 120).astype(float)
+    Freezing = fz.Measure_Freezing(Motion, 10, 3)
+    video_dict = {"file": "video.avi"}
+    df = fz.Summarize(video_dict, Motion, Freezing, 10, 3, 5, bin_dict=BINS)
+    motion, freezing = summarize_loop(Motion, Freezing, BINS)
+    assert list(df["bin"]) == list(BINS)
+    np.testing.assert_allclose(df["Motion"], motion)
+    np.testing.assert_allclose(df["Freezing"], freezing)
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice", "ignore:invalid value")
+def test_summarize_files_matches_slice_means_per_file():
+    rng = np.random.default_rng(1)
+    lengths = [120, 75, 33]
+    Motion = rng.integers(0, 50, (120, len(lengths))).astype(float)
+    Freezing = np.stack([fz.Measure_Freezing(m, 10, 3) for m in Motion.T], axis=1)
+    video_dict = {"FileNames": ["a.avi", "b.avi", "c.avi"]}
+    df = fz.Summarize_Files(
+        video_dict, Motion, Freezing, 10, 3, 5, bin_dict=BINS, FileLengths=lengths
+    )
+    for i, n in enumerate(lengths):
+        motion, freezing = summarize_loop(Motion[:n, i], Freezing[:n, i], BINS)
+        rows = df[df["File"] == video_dict["FileNames"][i]]
+        np.testing.assert_allclose(rows["Motion"], motion)
+        np.testing.assert_allclose(rows["Freezing"], freezing)
+
+
+def test_bins_in_seconds_match_frames():
+    Motion = np.random.default_rng(2).integers(0, 50, 300).astype(float)
+    Freezing = fz.Measure_Freezing(Motion, 10, 3)
+    seconds = {"a": (0, 2), "b": (None, 1.5), "c": (-3, None)}
+    frames = {"a": (0, 60), "b": (None, 45), "c": (-90, None)}
+    video_dict = {"file": "video.avi", "fps": 30}
+    by_seconds = fz.Summarize(
+        video_dict, Motion, Freezing, 10, 3, 5, bin_dict=seconds, units="seconds"
+    )
+    by_frames = fz.Summarize(video_dict, Motion, Freezing, 10, 3, 5, bin_dict=frames)
+    np.testing.assert_allclose(by_seconds["Motion"], by_frames["Motion"])
+
+
+def test_malformed_bins_raise():
+    Motion = np.zeros(10)
+    with pytest.raises(ValueError):
+        fz.Summarize({"file": "video.avi"}, Motion, Motion, 1, 1, 1, {"a": ("x", 5)})
+
+
+def test_p_frame_counts_persist_per_video(video_path, tmp_path, monkeypatch):
+    path = str(tmp_path / "video.avi")
+    with open(video_path, "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    counts = fz.p_frame_proportion(path, 50)
+    assert counts == (0, 50)
+
+    # a new process only has the sidecar
+    monkeypatch.setattr(fz, "_P_FRAME_CACHE", {})
+    monkeypatch.setattr(fz, "_count_p_frames", None)
+    assert fz.p_frame_proportion(path, 50) == counts
+
+    # a changed video is checked again
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    monkeypatch.setattr(fz, "_count_p_frames", lambda fpath, n: (3, n))
+    assert fz.p_frame_proportion(path, 50) == (3, 50)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_histogram_percentiles_within_half_a_bin(seed):
+    rng = np.random.default_rng(seed)
+    dif = np.abs(rng.normal(0, rng.uniform(0.05, 20), (50, 80))).astype(np.float32)
+    dif = np.minimum(dif, 255)
+    hist = fz.PixelChangeHistogram(bins_per_level=4)
+    hist.add(dif[:20])
+    hist.add(dif[20:])
+    for q in [0, 1, 50, 99, 99.99, 100]:
+        exact = np.percentile(dif.astype(np.float64), q)
+        assert abs(hist.percentile(q) - exact) <= hist.bin_width / 2 + 1e-6
+
+
+def motion_polygon_float64(path, mt_cutoff, polygon, SIGMA=1):
+    """Motion within a polygon, blurring the whole bounding box of the polygon."""
+    cap = cv2.VideoCapture(path)
+    Motion, frame_old = [], None
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        ymin, ymax, xmin, xmax = polygon.clip(*frame.shape[:2])
+        mask = polygon.mask(*frame.shape[:2]) > 0
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)[ymin:ymax, xmin:xmax]
+        frame = cv2.GaussianBlur(frame.astype("float"), (0, 0), SIGMA)
+        if frame_old is None:
+            Motion.append(0)
+        else:
+            changed = np.absolute(frame - frame_old) > mt_cutoff
+            Motion.append(np.sum(changed & mask))
+        frame_old = frame
+    cap.release()
+    return np.array(Motion, dtype=float)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_polygon_crop_counts_inside_the_polygon_only(video_path, n_workers):
+    # the moving square crosses the polygon edge
+    polygon = fz.CropSpec.polygon([20, 140, 140, 60], [10, 10, 100, 100])
+    expected = motion_polygon_float64(video_path, 10, polygon)
+    video = video_dict(video_path, crop=polygon)
+    result = fz.Measure_Motion(video, 10, n_workers=n_workers)
+    assert np.max(np.abs(result - expected)) <= 1
+    rois = fz.Measure_Motion(video, 10, rois=[polygon], n_workers=n_workers)
+    np.testing.assert_array_equal(rois[:, 0], result)
@@ -0,0 +1,43 @@
+"""TankCache reads must equal tdt.read_block reads."""
+
+import numpy as np
+import pytest
+from tdt import read_block
+
+import src.fiberphotometry as fp
+
+WINDOWS = [(0, 0), (10, 50), (25, 70), (20, 30), (19, 31), (5, 20), (64, 0), (6, 0)]
+
+
+@pytest.fixture(scope="module")
+def cache(tmp_path_factory):
+    return fp.TankCache(str(tmp_path_factory.mktemp("cache")))
+
+
+def assert_same_block(cached, direct):
+    for store in direct.streams.keys():
+        np.testing.assert_array_equal(
+            cached.streams[store].data, direct.streams[store].data
+        )
+        assert cached.streams[store].start_time == direct.streams[store].start_time
+    assert set(cached.epocs.keys()) == set(direct.epocs.keys())
+    for store in direct.epocs.keys():
+        for column in ("onset", "offset", "data"):
+            np.testing.assert_array_equal(
+                np.asarray(cached.epocs[store][column], dtype=float),
+                np.asarray(direct.epocs[store][column], dtype=float),
+            )
+
+
+@pytest.mark.parametrize("t1, t2", WINDOWS)
+def test_windowed_read_matches_read_block(tank_path, cache, t1, t2):
+    kwargs = {"t1": t1, "t2": t2, "evtype": ["streams", "epocs"]}
+    cached = cache.read_block(tank_path, **kwargs)
+    assert_same_block(cached, read_block(tank_path, **kwargs))
+
+
+@pytest.mark.parametrize("t1, t2", WINDOWS)
+def test_epoc_offsets_are_clipped_to_t2(tank_path, cache, t1, t2):
+    epocs = cache.read_block(tank_path, t1=t1, t2=t2, evtype=["epocs"]).epocs.TC1_
+    if t2 > 0 and len(epocs.offset):
+        assert np.max(epocs.offset) <= t2
@@ -0,0 +1,69 @@
+"""Clip extraction from videos."""
+
+import numpy as np
+import pytest
+
+import src.video as video
+
+av = pytest.importorskip("av")
+
+
+@pytest.fixture(scope="module")
+def b_frame_video(tmp_path_factory):
+    """mpeg4 video with a keyframe every 12 frames and two B-frames per P-frame."""
+    path = str(tmp_path_factory.mktemp("videos") / "b_frames.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 160, 120, "yuv420p"
+        stream.codec_context.gop_size = 12
+        stream.codec_context.max_b_frames = 2
+        for i in range(120):
+            image = np.full((120, 160, 3), 80, np.uint8)
+            image[30:50, (i * 3) % 140 : (i * 3) % 140 + 17] = 230
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    return path
+
+
+def decoded_frames(path):
+    with av.open(path) as container:
+        return sum(1 for _ in container.decode(video=0))
+
+
+def test_b_frames_before_a_keyframe_are_not_stream_copied(b_frame_video):
+    # frames 22 and 23 are B-frames that refer to the keyframe at frame 24
+    assert not video._cuts_on_keyframes(b_frame_video, 12, 23)
+
+
+@pytest.mark.parametrize("start, end", [(108, 119), (60, 119)])
+def test_stream_copy_keeps_every_frame(b_frame_video, tmp_path, start, end):
+    assert video._cuts_on_keyframes(b_frame_video, start, end)
+    clip = str(tmp_path / "clip.mp4")
+    assert video._copy_clip(b_frame_video, clip, start, end) == end - start + 1
+    assert decoded_frames(clip) == end - start + 1
+
+
+def test_copy_off_keyframes_raises(b_frame_video, tmp_path):
+    usb = video.UsbVideo(vid_path=b_frame_video)
+    with pytest.raises(ValueError):
+        usb.slice_video(12, 23, save_path=str(tmp_path / "clip.mp4"), method="copy")
+
+
+def test_video_capture_opens_on_first_access(b_frame_video):
+    usb = video.UsbVideo(vid_path=b_frame_video)
+    assert "video" not in vars(usb)
+    ret, frame = usb.video.read()
+    assert ret and frame.shape == (120, 160, 3)
+    assert usb.video is usb.video
+    usb.video.release()
+
+
+def test_cues_outside_the_video_are_not_written(b_frame_video, tmp_path):
+    usb = video.UsbVideo(vid_path=b_frame_video, preCue_onset=5, postCue_onset=10)
+    clips = usb.extract_cue_clips([-10, 1, 100], save_dir=str(tmp_path), mt_cutoff=10)
+    outside = [clips[0], clips[2]]
+    assert all(clip.path is None and clip.end == clip.start for clip in outside)
+    assert clips[1].path is not None and (clips[1].start, clips[1].end) == (25, 40)
+    assert decoded_frames(clips[1].path) == 15
+    assert len(clips[1].motion) == 15